@@ -1,8 +1,6 @@
 # import google.cloud.logging
 
 from google.cloud import firestore
-from google.cloud.firestore_v1.vector import Vector
-from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 
 import vertexai
 from vertexai.generative_models import GenerativeModel, GenerationConfig
@@ -11,14 +9,19 @@ from google.adk.agents import Agent
 from google.adk.agents.llm_agent import LlmAgent
 from google.adk.tools.mcp_tool.mcp_toolset import MCPToolset, StdioServerParameters
 
+from .context import assemble_context, dedupe_hits
+from .embedding_cache import EmbeddingCache
+from .retrieval import get_retriever
+
 
 # Initializing the Firebase client
 project_id = "joon-sandbox"
 location = "asia-southeast1"
 database_name = "test-db"
 
-# Set up the Firestore client
+# Set up the Firestore clients, the async one serves search_vector_database_async
 db = firestore.Client(project=project_id, database=database_name)
+async_db = firestore.AsyncClient(project=project_id, database=database_name)
 
 # Initialize Vertex AI with explicit project and location
 vertexai.init(project=project_id, location=location)
@@ -26,52 +29,59 @@ vertexai.init(project=project_id, location=location)
 # TODO: Instantiate a collection reference
 collection = db.collection("gchat_messages_v2")
 
+# Retrieval backend, selected per deployment with RAG_RETRIEVAL_BACKEND
+retriever = get_retriever(db, collection_names=[collection.id], async_db=async_db)
+
 # TODO: Instantiate an embedding model here
 embedding_model = VertexAIEmbeddings(model_name="text-embedding-005")
 
+# Repeated questions reuse their query embedding instead of calling Vertex again
+embedding_cache = EmbeddingCache(
+    embedding_model.embed_query,
+    model_name=embedding_model.model_name,
+    aembed_fn=embedding_model.aembed_query,
+)
+
 # TODO: Instantiate a Generative AI model here
 gen_model = model = GenerativeModel(
     model_name="gemini-1.5-pro",
     generation_config=GenerationConfig(temperature=0))
 
 def search_vector_database(query: str) -> list:
-    # For debugging - check if collection has documents
-    all_docs = list(collection.limit(3).stream())
-    # print(f"Collection has {len(all_docs)} documents")
-    if not all_docs:
-        return ["No documents found in the collection."]
-
     # 1. Generate the embedding of the query using the same model as data loading
     try:
 
-        query_embedding = embedding_model.embed_query(query)
+        query_embedding = embedding_cache.embed_query(query)
 
-        # Create a Vector object from the embedding values
-        query_vector = Vector(query_embedding)
+        # 2. Get the 5 best matches from the configured backend
+        docs = retriever.search(query_embedding, limit=5, query=query)
+        print(f"Vector query returned {len(docs)} documents")
 
-        # 2. Get the 5 nearest neighbors
-        vector_query = collection.find_nearest(
-            vector_field="embedding_map",
-            query_vector=query_vector,  # Use Vector object, not dictionary
-            distance_measure=DistanceMeasure.EUCLIDEAN,
-            limit=5,
-        )
+        if not docs:
+            return ["No relevant documents found for your query."]
 
-        # 3. Process results
-        docs = list(vector_query.stream())  # Convert to list to avoid stream consumption issues
+        # 3. Extract content from documents, skipping repeated messages
+        context = _to_context(docs)
+
+    except Exception as e:
+        print(f"Error in vector search: {e}")
+        context = f"Error performing vector search: {str(e)}"
+
+    return context
+
+
+async def search_vector_database_async(query: str) -> list:
+    """Async search_vector_database, so concurrent sessions don't wait on each other's retrieval."""
+    try:
+        query_embedding = await embedding_cache.aembed_query(query)
+
+        docs = await retriever.asearch(query_embedding, limit=5, query=query)
         print(f"Vector query returned {len(docs)} documents")
 
         if not docs:
             return ["No relevant documents found for your query."]
 
-        # Extract content from documents
-        context = [
-            {
-                "content": result.to_dict().get('content', ''),
-                "url": result.to_dict().get('url', '')
-                }
-            for result in docs
-            ]
+        context = _to_context(docs)
 
     except Exception as e:
         print(f"Error in vector search: {e}")
@@ -80,6 +90,37 @@ def search_vector_database(query: str) -> list:
     return context
 
 
+def _to_context(docs: list) -> list:
+    return [
+        {
+            "content": doc["content"],
+            "url": doc["url"]
+            }
+        for doc in dedupe_hits(docs)
+        ]
+
+
+prompt_template = """Answer the question using only the context below, and cite the source URLs you used.
+If the context doesn't contain the answer, say that you cannot find specific information about this in the available messages.
+
+Context:
+{context}
+
+Question: {question}
+"""
+
+
+def ask_gemini(question: str) -> str:
+    """Answer a question in a single Gemini call over the retrieved context."""
+    hits = search_vector_database(question)
+    if isinstance(hits, list) and all(isinstance(hit, dict) for hit in hits):
+        context = assemble_context(hits)
+    else:
+        context = str(hits)
+    response = gen_model.generate_content(prompt_template.format(context=context, question=question))
+    return response.text
+
+
 
 root_agent = Agent(
     name="system_activity_agent",
@@ -96,12 +137,12 @@ You are a retrieval assistant designed to help users answer questions using only
 
 1. **Mandatory First Step:**
 
-   * Always begin by calling the `search_vector_database` tool using a concise summary of the user’s question.
+   * Always begin by calling the `search_vector_database_async` tool using a concise summary of the user’s question.
    * This step is required *before* any answer attempt.
 
 2. **Restricted Source:**
 
-   * You are only allowed to answer questions using the content returned by `search_vector_database`.
+   * You are only allowed to answer questions using the content returned by `search_vector_database_async`.
    * Do **not** use any external knowledge, memory, or assumptions.
 
 3. **No Answer Case:**
@@ -130,7 +171,7 @@ You are a retrieval assistant designed to help users answer questions using only
 
     """
     ),
-    tools=[search_vector_database],
+    tools=[search_vector_database_async],
     )
 
 prompt = ("do you have any idea on why there are some data in looker_extraction.history (for history system activity) that have no connection_id ?")
@@ -0,0 +1,97 @@
+import re
+import time
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Iterable, Tuple
+
+import numpy as np
+
+
+# Words and identifiers such as connection_id, looker_extraction.history or 2024-05-01
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/:]\w+)*")
+SUBTOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms, keeping compound identifiers whole as well as their parts.
+
+    ``looker_extraction.history`` yields the full identifier plus ``looker``,
+    ``extraction`` and ``history``, so exact lookups rank highest while
+    partial mentions still match.
+    """
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        terms.append(token)
+        parts = SUBTOKEN_PATTERN.findall(token)
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """In-memory Okapi BM25 inverted index over document contents.
+
+    Each term maps to a posting array of document positions and a matching
+    array of precomputed BM25 weights, so a query only touches the postings of
+    its own terms. It has the same ``build``/``load``/``search`` shape as
+    ``LocalVectorIndex`` and can be kept in sync by ``FirestoreSyncedIndex``.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Dict[str, Any]] = []
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.built_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def build(self, records: Iterable[Tuple[Dict[str, Any], Any]]) -> None:
+        """Build the index from (doc, embedding) pairs; only the doc content is indexed."""
+        docs = []
+        term_positions = defaultdict(list)
+        term_counts = defaultdict(list)
+        lengths = []
+        for doc, _ in records:
+            counts = Counter(tokenize(doc.get("content", "")))
+            for term, count in counts.items():
+                term_positions[term].append(len(docs))
+                term_counts[term].append(count)
+            lengths.append(sum(counts.values()))
+            docs.append(doc)
+
+        lengths = np.asarray(lengths, dtype=np.float32)
+        avg_length = max(float(lengths.mean()), 1.0) if len(lengths) else 1.0
+        norms = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        postings = {}
+        for term, positions in term_positions.items():
+            positions = np.asarray(positions, dtype=np.int32)
+            tf = np.asarray(term_counts[term], dtype=np.float32)
+            idf = np.log(1 + (len(docs) - len(positions) + 0.5) / (len(positions) + 0.5))
+            postings[term] = (positions, (idf * tf * (self.k1 + 1) / (tf + norms[positions])).astype(np.float32))
+
+        # Swap in the new index together so concurrent searches see a consistent one
+        self.docs, self.postings, self.built_at = docs, postings, time.time()
+
+    def load(self) -> bool:
+        """The index is only kept in memory, so there is never a saved one to load."""
+        return False
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Return the ``limit`` best matching documents as (doc, BM25 score) pairs."""
+        docs, postings = self.docs, self.postings
+        scores = np.zeros(len(docs), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in postings:
+                positions, weights = postings[term]
+                scores[positions] += weights
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        limit = min(limit, len(matched))
+        top = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top])]
+
+        return [(docs[i], float(scores[i])) for i in top]
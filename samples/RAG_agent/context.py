@@ -0,0 +1,59 @@
+import os
+import hashlib
+from typing import List, Dict, Any
+
+
+# Rough size of the retrieved context handed to Gemini, in tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))
+
+# Approximate characters per token for English chat text
+CHARS_PER_TOKEN = 4
+
+
+def content_key(content: str) -> str:
+    """Hash of the content with case and whitespace collapsed, so reposted messages match."""
+    normalized = " ".join(content.split()).casefold()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def dedupe_hits(hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop hits whose content repeats an earlier, better ranked hit."""
+    seen = set()
+    unique = []
+    for hit in hits:
+        key = content_key(hit.get("content", ""))
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(hit)
+    return unique
+
+
+def assemble_context(hits: List[Dict[str, Any]], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Render deduplicated hits as compact text within ``token_budget``.
+
+    Hits are kept in rank order and grouped under their source URL, so a
+    thread's messages share one citation line. Whatever exceeds the budget
+    is cut, the last hit being truncated rather than dropped.
+    """
+    budget = token_budget * CHARS_PER_TOKEN
+    sources: Dict[str, List[str]] = {}
+    for hit in dedupe_hits(hits):
+        content = " ".join(hit.get("content", "").split())
+        if not content:
+            continue
+        url = hit.get("url", "")
+        header = 0 if url in sources else len(url) + len("Source: \n")
+        if header + len(content) > budget:
+            content = content[:max(budget - header, 0)]
+            if not content:
+                break
+        budget -= header + len(content)
+        sources.setdefault(url, []).append(content)
+        if budget <= 0:
+            break
+
+    return "\n\n".join(
+        f"Source: {url or 'unknown'}\n" + "\n".join(f"- {content}" for content in contents)
+        for url, contents in sources.items()
+    )
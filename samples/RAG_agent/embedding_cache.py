@@ -0,0 +1,162 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional
+
+
+# Optional SQLite file that keeps cached embeddings across restarts
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("RAG_EMBEDDING_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case so trivially different phrasings share an entry."""
+    return " ".join(query.split()).casefold()
+
+
+class EmbeddingCache:
+    """Bounded LRU + TTL cache in front of a query embedding call.
+
+    Entries are keyed on (model name, normalized query). When ``persist_path``
+    is set, misses are written through to a SQLite file and looked up there
+    before calling the model, so a restarted process starts warm.
+
+    ``aembed_query`` is the async counterpart; it calls ``aembed_fn`` on a
+    miss, or ``embed_fn`` in a worker thread when no async function is given.
+    Its SQLite reads and writes also run in a worker thread.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]], model_name: str,
+                 max_entries: int = EMBEDDING_CACHE_SIZE,
+                 ttl_seconds: float = EMBEDDING_CACHE_TTL_SECONDS,
+                 persist_path: Optional[str] = EMBEDDING_CACHE_PATH or None,
+                 aembed_fn: Optional[Callable[[str], Awaitable[List[float]]]] = None):
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite calls take their own lock, so a slow disk never holds up memory hits
+        self._db_lock = threading.Lock()
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, created_at REAL, vector TEXT)"
+            )
+            self._db.commit()
+
+    def _key(self, query: str) -> str:
+        return f"{self.model_name}:{normalize_query(query)}"
+
+    def embed_query(self, query: str) -> List[float]:
+        """Return the cached embedding for ``query``, computing it on a miss."""
+        key = self._key(query)
+        vector = self._lookup(key)
+        if vector is None:
+            # Call the model outside the lock so concurrent misses don't serialize
+            vector = self.embed_fn(query)
+            self._save(key, vector)
+        return vector
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async ``embed_query``; the event loop is never blocked on the model call or SQLite."""
+        key = self._key(query)
+        vector = self._lookup_memory(key)
+        if vector is None and self._db is not None:
+            vector = await asyncio.to_thread(self._lookup_persisted, key)
+        self._count(vector is not None)
+        if vector is None:
+            if self.aembed_fn is not None:
+                vector = await self.aembed_fn(query)
+            else:
+                vector = await asyncio.to_thread(self.embed_fn, query)
+            now = time.time()
+            with self._lock:
+                self._store(key, (now, vector))
+            if self._db is not None:
+                await asyncio.to_thread(self._persist, key, now, vector)
+        return vector
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        vector = self._lookup_memory(key)
+        if vector is None and self._db is not None:
+            vector = self._lookup_persisted(key)
+        self._count(vector is not None)
+        return vector
+
+    def _lookup_memory(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return entry[1]
+            return None
+
+    def _lookup_persisted(self, key: str) -> Optional[List[float]]:
+        with self._db_lock:
+            entry = self._load(key, time.time())
+        if entry is None:
+            return None
+        with self._lock:
+            self._store(key, entry)
+        return entry[1]
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _save(self, key: str, vector: List[float]) -> None:
+        now = time.time()
+        with self._lock:
+            self._store(key, (now, vector))
+        if self._db is not None:
+            self._persist(key, now, vector)
+
+    def _persist(self, key: str, created_at: float, vector: List[float]) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                (key, created_at, json.dumps(vector)),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+    def _load(self, key: str, now: float):
+        """Look up a key in the persistent tier, ignoring expired rows."""
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT created_at, vector FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[0] >= self.ttl_seconds:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _store(self, key: str, entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
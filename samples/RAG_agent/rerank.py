@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Callable, List, Dict, Any, Optional
+
+import numpy as np
+
+
+# How many candidates are fetched for reranking, and how many seconds reranking may take
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "50"))
+RERANK_TIME_BUDGET_SECONDS = float(os.getenv("RAG_RERANK_TIME_BUDGET_SECONDS", "0.5"))
+
+# Trade-off between relevance (1.0) and diversity (0.0) in maximal marginal relevance
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+
+# Optional sentence-transformers cross-encoder, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+
+
+def mmr(query_vector: np.ndarray, vectors: np.ndarray, limit: int, lambda_mult: float = MMR_LAMBDA,
+        deadline: Optional[float] = None) -> List[int]:
+    """Select ``limit`` rows of ``vectors`` by maximal marginal relevance to the query.
+
+    Cosine similarities are computed once as matrices; each step only updates
+    every candidate's max similarity to the selection with one vector op. If
+    ``deadline`` passes, the remaining slots are filled by relevance alone.
+    """
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+    relevance = vectors @ query_vector
+
+    limit = min(limit, len(vectors))
+    selected: List[int] = []
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    while len(selected) < limit:
+        if deadline is not None and time.monotonic() > deadline:
+            rest = [i for i in np.argsort(-relevance) if available[i]]
+            return selected + rest[:limit - len(selected)]
+        if selected:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        else:
+            scores = relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, vectors @ vectors[best], out=redundancy)
+    return selected
+
+
+def load_cross_encoder(model_name: str = RERANK_MODEL) -> Optional[Callable[[str, List[str]], List[float]]]:
+    """Return a (query, contents) -> scores function, or None if no model is configured or installed."""
+    if not model_name:
+        return None
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        print(f"sentence-transformers is not installed, skipping the {model_name} reranker")
+        return None
+
+    model = CrossEncoder(model_name)
+    return lambda query, contents: model.predict([(query, content) for content in contents]).tolist()
+
+
+class Reranker:
+    """Diversify over-fetched hits with MMR, then optionally reorder them with a local cross-encoder.
+
+    Hits need an ``embedding``; hits without one (keyword-only matches) keep
+    their rank position and MMR fills the other slots. The whole stage returns
+    within ``time_budget`` seconds: MMR falls back to plain relevance order when
+    it runs out, and the cross-encoder runs on a worker thread whose scores are
+    dropped if they arrive after the deadline. ``model_name`` is loaded on that
+    thread at the first rerank, not at construction.
+    """
+
+    def __init__(self, lambda_mult: float = MMR_LAMBDA, time_budget: float = RERANK_TIME_BUDGET_SECONDS,
+                 score_fn: Optional[Callable[[str, List[str]], List[float]]] = None,
+                 model_name: str = RERANK_MODEL):
+        self.lambda_mult = lambda_mult
+        self.time_budget = time_budget
+        self.score_fn = score_fn
+        self.model_name = "" if score_fn else model_name
+        self._load_lock = threading.Lock()
+        self._scorer = None
+
+    @property
+    def uses_model(self) -> bool:
+        """Whether reranking runs a cross-encoder, and is too slow for the event loop."""
+        return self.score_fn is not None or bool(self.model_name)
+
+    def _score(self, query: str, contents: List[str]) -> Optional[List[float]]:
+        with self._load_lock:
+            if self.score_fn is None and self.model_name:
+                self.score_fn = load_cross_encoder(self.model_name)
+                if self.score_fn is None:
+                    self.model_name = ""
+        return self.score_fn(query, contents) if self.score_fn else None
+
+    def _score_within(self, query: str, contents: List[str], deadline: float) -> Optional[List[float]]:
+        if self._scorer is None:
+            with self._load_lock:
+                if self._scorer is None:
+                    # One worker, so late scoring calls queue up instead of piling onto the CPU
+                    self._scorer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        future = self._scorer.submit(self._score, query, contents)
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0.0))
+        except TimeoutError:
+            future.cancel()
+            print(f"Cross-encoder did not finish within {self.time_budget}s, keeping the MMR order")
+            return None
+
+    def rerank(self, query_vector: List[float], hits: List[Dict[str, Any]], limit: int,
+               query: str = "") -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + self.time_budget
+        embedded = [hit for hit in hits if hit.get("embedding") is not None]
+        if embedded:
+            order = mmr(
+                np.asarray(query_vector, dtype=np.float32),
+                np.asarray([hit["embedding"] for hit in embedded], dtype=np.float32),
+                limit,
+                self.lambda_mult,
+                deadline,
+            )
+            diversified = iter([embedded[i] for i in order])
+            reranked = []
+            for hit in hits:
+                if len(reranked) == limit:
+                    break
+                if hit.get("embedding") is None:
+                    reranked.append(hit)
+                else:
+                    next_hit = next(diversified, None)
+                    if next_hit is not None:
+                        reranked.append(next_hit)
+            hits = reranked
+        else:
+            hits = hits[:limit]
+
+        if self.uses_model and query and time.monotonic() < deadline:
+            scores = self._score_within(query, [hit.get("content", "") for hit in hits], deadline)
+            if scores is not None:
+                order = sorted(range(len(hits)), key=lambda i: -scores[i])
+                hits = [hits[i] for i in order]
+        return hits
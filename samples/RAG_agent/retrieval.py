@@ -0,0 +1,305 @@
+import os
+import time
+import asyncio
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any
+
+from google.cloud.firestore_v1.vector import Vector
+from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
+
+
+# Which retrieval backend search_vector_database uses: "firestore", "local", "keyword" or "hybrid"
+RETRIEVAL_BACKEND = os.getenv("RAG_RETRIEVAL_BACKEND", "firestore")
+
+# Vector backend whose results the hybrid retriever fuses with BM25 keyword matches
+HYBRID_DENSE_BACKEND = os.getenv("RAG_HYBRID_DENSE_BACKEND", "firestore")
+
+# Candidates taken from each ranking before fusion, and the RRF damping constant
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Retrieval results are reused for the same query embedding for this long
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RAG_RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RAG_RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+
+# Whether to over-fetch candidates and rerank them with MMR (and RAG_RERANK_MODEL if set)
+RERANK = os.getenv("RAG_RERANK", "false").lower() == "true"
+
+# Collections served by the retriever
+INDEX_COLLECTIONS = os.getenv("RAG_INDEX_COLLECTIONS", "gchat_messages_v2").split(",")
+
+# How often the local index is rebuilt from Firestore, in seconds (0 disables)
+INDEX_REFRESH_SECONDS = float(os.getenv("RAG_INDEX_REFRESH_SECONDS", "3600"))
+
+
+class FirestoreRetriever:
+    """Nearest-neighbour search with Firestore ``find_nearest``, one round trip per query.
+
+    ``asearch`` uses ``async_db``, a Firestore ``AsyncClient``, when given, and
+    queries all collections concurrently without blocking the event loop.
+    Hits carry their ``embedding`` only with ``with_embeddings``, for reranking.
+    """
+
+    def __init__(self, db, collection_names: List[str], async_db=None, with_embeddings: bool = False):
+        self.collections = [db.collection(name) for name in collection_names]
+        self.async_collections = [async_db.collection(name) for name in collection_names] if async_db else None
+        self.with_embeddings = with_embeddings
+
+    @staticmethod
+    def _vector_query(collection, query_vector: List[float], limit: int):
+        return collection.find_nearest(
+            vector_field="embedding_map",
+            query_vector=Vector(query_vector),
+            distance_measure=DistanceMeasure.EUCLIDEAN,
+            limit=limit,
+            distance_result_field="vector_distance",
+        )
+
+    def _to_hit(self, result) -> Dict[str, Any]:
+        data = result.to_dict()
+        hit = {
+            "id": result.id,
+            "content": data.get("content", ""),
+            "url": data.get("url", ""),
+            "distance": data.get("vector_distance"),
+        }
+        if self.with_embeddings:
+            embedding = data.get("embedding_map")
+            hit["embedding"] = list(embedding) if embedding is not None else None
+        return hit
+
+    def _merge(self, hits: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+        if len(self.collections) > 1:
+            hits.sort(key=lambda hit: hit["distance"])
+        return hits[:limit]
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        hits = []
+        for collection in self.collections:
+            for result in self._vector_query(collection, query_vector, limit).stream():
+                hits.append(self._to_hit(result))
+        return self._merge(hits, limit)
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        if self.async_collections is None:
+            return await asyncio.to_thread(self.search, query_vector, limit, query)
+
+        async def search_collection(collection):
+            vector_query = self._vector_query(collection, query_vector, limit)
+            return [self._to_hit(result) async for result in vector_query.stream()]
+
+        results = await asyncio.gather(*[search_collection(c) for c in self.async_collections])
+        return self._merge([hit for hits in results for hit in hits], limit)
+
+
+class LocalIndexRetriever:
+    """Nearest-neighbour search against the in-process index, no network calls per query."""
+
+    def __init__(self, db, collection_names: List[str], async_db=None, with_embeddings: bool = False):
+        from .vector_index import FirestoreSyncedIndex
+
+        self.index = FirestoreSyncedIndex(
+            db, collection_names, refresh_interval=INDEX_REFRESH_SECONDS
+        )
+        self.with_embeddings = with_embeddings
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        hits = []
+        for doc, distance in self.index.search(query_vector, limit):
+            hit = {"id": doc["id"], "content": doc["content"], "url": doc["url"], "distance": distance}
+            if self.with_embeddings:
+                hit["embedding"] = self.index.index.vector(doc["id"])
+            hits.append(hit)
+        return hits
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        # The scan is CPU-bound, run it in a thread so other sessions keep going
+        return await asyncio.to_thread(self.search, query_vector, limit, query)
+
+
+class KeywordRetriever:
+    """BM25 keyword search over an in-process inverted index of the Firestore content.
+
+    Catches exact identifiers like ``connection_id`` that embeddings tend to blur.
+    The index only reads ``url`` and ``content``, so documents without an
+    embedding are searchable too. With ``build_in_background`` it is built
+    without blocking startup and returns no hits until ready.
+    """
+
+    def __init__(self, db, collection_names: List[str], async_db=None, with_embeddings: bool = False,
+                 build_in_background: bool = False):
+        from .bm25 import BM25Index
+        from .vector_index import FirestoreSyncedIndex, firestore_documents
+
+        self.index = FirestoreSyncedIndex(
+            db, collection_names, index=BM25Index(), refresh_interval=INDEX_REFRESH_SECONDS,
+            records=firestore_documents, build_in_background=build_in_background,
+        )
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": doc["id"],
+                "content": doc["content"],
+                "url": doc["url"],
+                "score": score,
+            }
+            for doc, score in self.index.search(query, limit)
+        ]
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.search, query_vector, limit, query)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Merge ranked hit lists by summing 1 / (k + rank) per document id."""
+    scores = {}
+    hits = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit["id"]] = scores.get(hit["id"], 0.0) + 1.0 / (k + rank)
+            hits.setdefault(hit["id"], hit)
+
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return [dict(hits[doc_id], rrf_score=scores[doc_id]) for doc_id in fused]
+
+
+class HybridRetriever:
+    """Vector search fused with BM25 keyword search by reciprocal-rank fusion.
+
+    The keyword index is built in the background, results are vector-only until it is ready.
+    """
+
+    def __init__(self, db, collection_names: List[str], async_db=None, with_embeddings: bool = False):
+        self.dense = RETRIEVERS[HYBRID_DENSE_BACKEND](
+            db, collection_names, async_db=async_db, with_embeddings=with_embeddings
+        )
+        self.keyword = KeywordRetriever(db, collection_names, build_in_background=True)
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        candidates = max(limit, HYBRID_CANDIDATES)
+        rankings = [self.dense.search(query_vector, candidates)]
+        if query:
+            rankings.append(self.keyword.search(query_vector, candidates, query=query))
+        return reciprocal_rank_fusion(rankings)[:limit]
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        candidates = max(limit, HYBRID_CANDIDATES)
+        searches = [self.dense.asearch(query_vector, candidates)]
+        if query:
+            searches.append(self.keyword.asearch(query_vector, candidates, query=query))
+        return reciprocal_rank_fusion(await asyncio.gather(*searches))[:limit]
+
+
+RETRIEVERS = {
+    "firestore": FirestoreRetriever,
+    "local": LocalIndexRetriever,
+    "keyword": KeywordRetriever,
+    "hybrid": HybridRetriever,
+}
+
+
+class RerankingRetriever:
+    """Over-fetches candidates from a retriever and reranks them down to ``limit``."""
+
+    def __init__(self, retriever, candidates: int = None, reranker=None):
+        from .rerank import RERANK_CANDIDATES, Reranker
+
+        self.retriever = retriever
+        self.candidates = candidates or RERANK_CANDIDATES
+        self.reranker = reranker or Reranker()
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        hits = self.retriever.search(query_vector, max(limit, self.candidates), query=query)
+        return self._rerank(query_vector, hits, limit, query)
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        hits = await self.retriever.asearch(query_vector, max(limit, self.candidates), query=query)
+        if self.reranker.uses_model:
+            # A cross-encoder is too slow to run on the event loop
+            return await asyncio.to_thread(self._rerank, query_vector, hits, limit, query)
+        return self._rerank(query_vector, hits, limit, query)
+
+    def _rerank(self, query_vector: List[float], hits: List[Dict[str, Any]], limit: int,
+                query: str) -> List[Dict[str, Any]]:
+        hits = self.reranker.rerank(query_vector, hits, limit, query=query)
+        # Embeddings were only needed for reranking, don't keep them in caches or prompts
+        return [{key: value for key, value in hit.items() if key != "embedding"} for hit in hits]
+
+
+class CachedRetriever:
+    """Bounded LRU + TTL cache of search results in front of any retriever.
+
+    Entries are keyed on the exact query embedding, the query text and the
+    limit. The embedding cache returns the same vector for repeated questions,
+    so those skip retrieval entirely. The TTL bounds how stale results get
+    while new messages are ingested.
+    """
+
+    def __init__(self, retriever, max_entries: int = RETRIEVAL_CACHE_SIZE,
+                 ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS):
+        self.retriever = retriever
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query_vector: List[float], limit: int, query: str) -> str:
+        digest = hashlib.sha1(struct.pack(f"{len(query_vector)}f", *query_vector))
+        digest.update(f"{limit}:{query}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def search(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        key = self._key(query_vector, limit, query)
+        hits = self._get(key)
+        if hits is None:
+            hits = self.retriever.search(query_vector, limit, query=query)
+            self._put(key, hits)
+        return hits
+
+    async def asearch(self, query_vector: List[float], limit: int = 5, query: str = "") -> List[Dict[str, Any]]:
+        key = self._key(query_vector, limit, query)
+        hits = self._get(key)
+        if hits is None:
+            hits = await self.retriever.asearch(query_vector, limit, query=query)
+            self._put(key, hits)
+        return hits
+
+    def _get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _put(self, key: str, hits: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), hits)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_retriever(db, backend: str = RETRIEVAL_BACKEND, collection_names: List[str] = None, async_db=None):
+    """Create the retriever configured for this deployment; pass ``async_db`` to make ``asearch`` fully async."""
+    if backend not in RETRIEVERS:
+        raise ValueError(f"Unknown retrieval backend {backend!r}, expected one of {sorted(RETRIEVERS)}")
+    # Hits only carry embeddings when they are reranked
+    retriever = RETRIEVERS[backend](
+        db, collection_names or INDEX_COLLECTIONS, async_db=async_db, with_embeddings=RERANK
+    )
+    if RERANK:
+        retriever = RerankingRetriever(retriever)
+    if RETRIEVAL_CACHE_SIZE > 0:
+        retriever = CachedRetriever(retriever)
+    return retriever
@@ -0,0 +1,269 @@
+"""Tests for the retrieval modules.
+
+Run from the samples directory: python -m pytest RAG_agent/tests
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from RAG_agent.bm25 import BM25Index, tokenize
+from RAG_agent.context import assemble_context
+from RAG_agent.embedding_cache import EmbeddingCache
+from RAG_agent.rerank import Reranker, mmr
+from RAG_agent.retrieval import CachedRetriever, reciprocal_rank_fusion
+from RAG_agent.vector_index import LocalVectorIndex, quantize_binary, quantize_int8
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, query):
+        self.queries.append(query)
+        return [float(len(query)), 1.0]
+
+
+class TestEmbeddingCache(unittest.TestCase):
+
+    def test_normalized_queries_share_an_entry(self):
+        embed = CountingEmbedder()
+        cache = EmbeddingCache(embed, "model", persist_path=None)
+        first = cache.embed_query("How do I  reset my password?")
+        self.assertEqual(cache.embed_query("how do i reset my PASSWORD?"), first)
+        self.assertEqual(len(embed.queries), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        embed = CountingEmbedder()
+        cache = EmbeddingCache(embed, "model", max_entries=2, persist_path=None)
+        for query in ["a", "b", "a", "c", "a", "b"]:
+            cache.embed_query(query)
+        self.assertEqual(embed.queries, ["a", "b", "c", "b"])
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_expired_entries_are_recomputed(self):
+        embed = CountingEmbedder()
+        cache = EmbeddingCache(embed, "model", ttl_seconds=0, persist_path=None)
+        cache.embed_query("a")
+        cache.embed_query("a")
+        self.assertEqual(embed.queries, ["a", "a"])
+
+    def test_persisted_entries_survive_a_restart(self):
+        path = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite")
+        embed = CountingEmbedder()
+        vector = EmbeddingCache(embed, "model", persist_path=path).embed_query("a")
+
+        restarted = EmbeddingCache(embed, "model", persist_path=path)
+        self.assertEqual(asyncio.run(restarted.aembed_query("a")), vector)
+        self.assertEqual(asyncio.run(restarted.aembed_query("bb")), [2.0, 1.0])
+        self.assertEqual(embed.queries, ["a", "bb"])
+
+        # Entries are keyed on the model, so another model never reuses them
+        EmbeddingCache(embed, "other-model", persist_path=path).embed_query("a")
+        self.assertEqual(embed.queries, ["a", "bb", "a"])
+
+    def test_async_embed_function(self):
+        calls = []
+
+        async def aembed(query):
+            calls.append(query)
+            return [1.0]
+
+        async def run():
+            cache = EmbeddingCache(CountingEmbedder(), "model", persist_path=None, aembed_fn=aembed)
+            return [await cache.aembed_query("a"), await cache.aembed_query("A ")]
+
+        self.assertEqual(asyncio.run(run()), [[1.0], [1.0]])
+        self.assertEqual(calls, ["a"])
+
+
+class FakeRetriever:
+    def __init__(self):
+        self.searches = 0
+
+    def search(self, query_vector, limit=5, query=""):
+        self.searches += 1
+        return [{"id": str(i)} for i in range(limit)]
+
+    async def asearch(self, query_vector, limit=5, query=""):
+        return self.search(query_vector, limit, query)
+
+
+class TestRetrieval(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion(self):
+        dense = [{"id": "a", "distance": 0.1}, {"id": "b", "distance": 0.2}, {"id": "c", "distance": 0.3}]
+        keyword = [{"id": "c", "score": 5.0}, {"id": "d", "score": 1.0}]
+        fused = reciprocal_rank_fusion([dense, keyword], k=60)
+        self.assertEqual([hit["id"] for hit in fused], ["c", "a", "b", "d"])
+        self.assertAlmostEqual(fused[0]["rrf_score"], 1 / 63 + 1 / 61)
+        # The first ranking's copy of a hit is kept
+        self.assertEqual(fused[0]["distance"], 0.3)
+
+    def test_cached_retriever(self):
+        retriever = FakeRetriever()
+        cached = CachedRetriever(retriever, max_entries=2)
+        hits = cached.search([0.1, 0.2], 3, query="q")
+        self.assertIs(cached.search([0.1, 0.2], 3, query="q"), hits)
+        self.assertIs(asyncio.run(cached.asearch([0.1, 0.2], 3, query="q")), hits)
+        self.assertEqual(retriever.searches, 1)
+
+        cached.search([0.1, 0.2], 4, query="q")
+        cached.search([0.1, 0.2], 3, query="other")
+        cached.search([0.3, 0.2], 3, query="q")
+        self.assertEqual(retriever.searches, 4)
+        # Only the two most recent entries are kept
+        cached.search([0.1, 0.2], 3, query="q")
+        self.assertEqual(retriever.searches, 5)
+        self.assertEqual((cached.hits, cached.misses), (2, 5))
+
+    def test_cached_retriever_expires_entries(self):
+        retriever = FakeRetriever()
+        cached = CachedRetriever(retriever, ttl_seconds=0)
+        cached.search([0.1], 3)
+        cached.search([0.1], 3)
+        self.assertEqual(retriever.searches, 2)
+
+
+class TestBM25(unittest.TestCase):
+
+    def test_tokenize_keeps_identifiers_and_parts(self):
+        self.assertEqual(
+            tokenize("Check looker_extraction.history now"),
+            ["check", "looker_extraction.history", "looker", "extraction", "history", "now"],
+        )
+
+    def test_search(self):
+        index = BM25Index()
+        docs = [
+            {"id": "1", "content": "The connection_id column is missing from the table"},
+            {"id": "2", "content": "Every connection dropped after the deploy"},
+            {"id": "3", "content": "Lunch is at noon"},
+        ]
+        index.build((doc, None) for doc in docs)
+        # The whole identifier outranks a doc that only shares one of its parts
+        self.assertEqual([doc["id"] for doc, _ in index.search("connection_id")], ["1", "2"])
+        results = index.search("connection dropped", limit=5)
+        self.assertEqual([doc["id"] for doc, _ in results], ["2", "1"])
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual(index.search("dinner"), [])
+
+
+class TestRerank(unittest.TestCase):
+
+    def setUp(self):
+        self.query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        # Two near duplicates most similar to the query, then a different angle
+        self.vectors = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.8, 0.0, 0.6]], dtype=np.float32)
+
+    def test_mmr_skips_near_duplicates(self):
+        self.assertEqual(mmr(self.query, self.vectors, 2, lambda_mult=0.3), [0, 2])
+        self.assertEqual(mmr(self.query, self.vectors, 2, lambda_mult=1.0), [0, 1])
+
+    def test_mmr_falls_back_to_relevance_past_the_deadline(self):
+        order = mmr(self.query, self.vectors, 3, lambda_mult=0.3, deadline=time.monotonic() - 1)
+        self.assertEqual(order, [0, 1, 2])
+
+    def test_rerank_keeps_hits_without_embeddings_in_place(self):
+        hits = [
+            {"id": "a", "embedding": self.vectors[0]},
+            {"id": "keyword", "embedding": None},
+            {"id": "b", "embedding": self.vectors[1]},
+            {"id": "c", "embedding": self.vectors[2]},
+        ]
+        reranked = Reranker(lambda_mult=0.3, model_name="").rerank(self.query, hits, 3)
+        self.assertEqual([hit["id"] for hit in reranked], ["a", "keyword", "c"])
+
+    def test_cross_encoder_reorders_hits(self):
+        hits = [{"id": "a", "content": "short"}, {"id": "b", "content": "much longer"}]
+        reranker = Reranker(score_fn=lambda query, contents: [len(content) for content in contents])
+        self.assertEqual([hit["id"] for hit in reranker.rerank(self.query, hits, 2, query="q")], ["b", "a"])
+
+    def test_slow_cross_encoder_keeps_the_mmr_order(self):
+        def slow_scores(query, contents):
+            time.sleep(0.5)
+            return list(range(len(contents)))
+
+        hits = [{"id": "a", "content": "x"}, {"id": "b", "content": "y"}]
+        reranker = Reranker(time_budget=0.05, score_fn=slow_scores)
+        started = time.monotonic()
+        reranked = reranker.rerank(self.query, hits, 2, query="q")
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual([hit["id"] for hit in reranked], ["a", "b"])
+
+
+class TestVectorIndex(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.standard_normal((300, 16)).astype(np.float32)
+        self.records = [({"id": str(i), "content": "", "url": ""}, vector.tolist())
+                        for i, vector in enumerate(self.embeddings)]
+        self.query = self.embeddings[42] + 0.01
+
+    def exact_search(self, limit):
+        distances = np.linalg.norm(self.embeddings - self.query, axis=1)
+        return [str(i) for i in np.argsort(distances)[:limit]]
+
+    def test_quantize_int8(self):
+        codes, scales = quantize_int8(self.embeddings)
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(np.abs(codes).max(axis=1).tolist(), [127] * len(codes))
+        error = np.abs(codes * scales[:, None] - self.embeddings).max(axis=1)
+        self.assertTrue(np.all(error <= scales / 2 + 1e-6))
+
+        codes, scales = quantize_int8(np.zeros((1, 4), dtype=np.float32))
+        self.assertEqual((codes.tolist(), scales.tolist()), ([[0, 0, 0, 0]], [1.0]))
+
+    def test_quantize_binary(self):
+        bits = quantize_binary(np.array([[0.5, -1.0, 0.0, 2.0, -0.1, 0.3, 0.2, -0.2, 1.0]]))
+        self.assertEqual(bits.tolist(), [[0b10010110, 0b10000000]])
+
+    def test_quantized_search_matches_exact_search(self):
+        expected = self.exact_search(5)
+        for quantization in ("none", "int8", "binary"):
+            index = LocalVectorIndex(tempfile.mkdtemp(), dim=16, quantization=quantization)
+            index.build(self.records)
+            results = index.search(self.query.tolist(), 5)
+            self.assertEqual(results[0][0]["id"], "42", quantization)
+            if quantization != "binary":
+                self.assertEqual([doc["id"] for doc, _ in results], expected, quantization)
+            # Distances are always exact, whatever the scan used
+            for doc, distance in results:
+                exact = np.linalg.norm(self.embeddings[int(doc["id"])] - self.query)
+                self.assertAlmostEqual(distance, float(exact), places=4)
+
+    def test_quantized_codes_are_computed_for_older_indexes(self):
+        index_dir = tempfile.mkdtemp()
+        LocalVectorIndex(index_dir, dim=16).build(self.records)
+        index = LocalVectorIndex(index_dir, dim=16, quantization="int8")
+        self.assertTrue(index.load())
+        self.assertEqual([doc["id"] for doc, _ in index.search(self.query.tolist(), 5)], self.exact_search(5))
+
+
+class TestContext(unittest.TestCase):
+
+    def test_duplicates_are_dropped_and_sources_grouped(self):
+        hits = [
+            {"url": "chat/1", "content": "Restart  the worker"},
+            {"url": "chat/2", "content": "Check the logs"},
+            {"url": "chat/1", "content": "restart the WORKER"},
+            {"url": "chat/1", "content": "It works now"},
+        ]
+        self.assertEqual(
+            assemble_context(hits),
+            "Source: chat/1\n- Restart the worker\n- It works now\n\nSource: chat/2\n- Check the logs",
+        )
+
+    def test_last_hit_is_truncated_to_the_budget(self):
+        hits = [{"url": "u", "content": "a" * 20}, {"url": "u", "content": "b" * 20}, {"url": "v", "content": "c"}]
+        # 10 tokens are 40 characters, 10 of which go to the "Source: u" line
+        self.assertEqual(assemble_context(hits, token_budget=10), "Source: u\n- " + "a" * 20 + "\n- " + "b" * 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+"""Tests for the ingestion utilities.
+
+Run from the samples directory: python -m pytest RAG_agent/tests
+"""
+
+import asyncio
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from google.api_core.exceptions import InvalidArgument
+from RAG_agent.util import json_stream
+from RAG_agent.util.bulk_writer import AsyncBulkWriter
+from RAG_agent.util.embedding_batcher import EmbeddingBatcher
+from RAG_agent.util.manifest import IngestionManifest
+from RAG_agent.util.pipeline import Pipeline, Stage
+from RAG_agent.util.rate_limiter import TokenBucket
+
+
+class FakeDocument:
+    def __init__(self, db, doc_id):
+        self.db = db
+        self.id = doc_id
+
+    def set(self, data):
+        if self.id in self.db.failing:
+            raise RuntimeError(f"write to {self.id} failed")
+        self.db.docs[self.id] = data
+
+    def delete(self):
+        self.db.docs.pop(self.id, None)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.writes = []
+
+    def set(self, doc_ref, data):
+        self.writes.append((doc_ref, data))
+
+    def delete(self, doc_ref):
+        self.writes.append((doc_ref, None))
+
+    def commit(self):
+        if any(doc_ref.id in self.db.failing for doc_ref, _ in self.writes):
+            raise RuntimeError("batch commit failed")
+        for doc_ref, data in self.writes:
+            if data is None:
+                doc_ref.delete()
+            else:
+                doc_ref.set(data)
+
+
+class FakeDatabase:
+    def __init__(self, failing=()):
+        self.docs = {}
+        self.failing = set(failing)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def document(self, doc_id):
+        return FakeDocument(self, doc_id)
+
+
+class TestIngestion(unittest.TestCase):
+
+    def setUp(self):
+        self.manifest_path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+        self.manifest = IngestionManifest(self.manifest_path)
+        self.manifest.start_page("page", "2024-05-01", ["ok", "failing"])
+
+    def write_chunks(self, db):
+        async def run():
+            writer = AsyncBulkWriter(db, max_retries=1)
+            for doc_id in ["ok", "failing"]:
+                written = await writer.set(db.document(doc_id), {"content": doc_id})
+                self.assertFalse(written.done())
+                self.manifest.record_when_written(written, "page", doc_id, doc_id)
+            self.assertEqual(self.manifest.pages["page"]["chunks"], {})
+            await writer.close()
+
+        asyncio.run(run())
+        self.manifest.save()
+        return IngestionManifest(self.manifest_path)
+
+    def test_manifest_records_committed_writes(self):
+        manifest = self.write_chunks(FakeDatabase())
+        self.assertTrue(manifest.page_unchanged("page", "2024-05-01"))
+
+    def test_manifest_skips_failed_writes(self):
+        db = FakeDatabase(failing=["failing"])
+        manifest = self.write_chunks(db)
+        self.assertIn("ok", db.docs)
+        self.assertTrue(manifest.chunk_unchanged("page", "ok", "ok"))
+        self.assertFalse(manifest.chunk_unchanged("page", "failing", "failing"))
+        self.assertFalse(manifest.page_unchanged("page", "2024-05-01"))
+
+
+class TestJsonStream(unittest.TestCase):
+
+    def test_iter_json_array_across_reads(self):
+        text = '[12345, 678, "a long string", {"id": 1, "tags": ["x", "y"]}, true, 1.5e3, null]'
+        for read_size in range(1, 8):
+            with mock.patch.object(json_stream, "READ_SIZE", read_size):
+                items = list(json_stream.iter_json_array(io.StringIO(text)))
+            self.assertEqual(items, [12345, 678, "a long string", {"id": 1, "tags": ["x", "y"]}, True, 1500.0, None])
+
+    def test_iter_json_array_unterminated(self):
+        with mock.patch.object(json_stream, "READ_SIZE", 2):
+            with self.assertRaises(ValueError):
+                list(json_stream.iter_json_array(io.StringIO("[1, 2")))
+
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeEmbeddingModel:
+    def __init__(self, invalid=()):
+        self.requests = []
+        self.invalid = set(invalid)
+
+    def get_embeddings(self, texts):
+        self.requests.append(list(texts))
+        if self.invalid.intersection(texts):
+            raise InvalidArgument("input rejected")
+        return [FakeEmbedding([float(len(text))]) for text in texts]
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+
+    def test_concurrent_texts_share_requests(self):
+        model = FakeEmbeddingModel()
+
+        async def run():
+            batcher = EmbeddingBatcher(model, max_instances=2, max_delay=0.01)
+            return await asyncio.gather(*[batcher.embed("x" * n) for n in range(1, 6)])
+
+        self.assertEqual(asyncio.run(run()), [[1.0], [2.0], [3.0], [4.0], [5.0]])
+        self.assertEqual([len(texts) for texts in model.requests], [2, 2, 1])
+
+    def test_rejected_text_only_fails_itself(self):
+        model = FakeEmbeddingModel(invalid=["bad"])
+
+        async def run():
+            batcher = EmbeddingBatcher(model, max_delay=0.01)
+            return await asyncio.gather(
+                *[batcher.embed(text) for text in ["a", "bad", "ccc", "dd"]], return_exceptions=True
+            )
+
+        a, bad, ccc, dd = asyncio.run(run())
+        self.assertIsInstance(bad, InvalidArgument)
+        self.assertEqual((a, ccc, dd), ([1.0], [3.0], [2.0]))
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_items_flow_through_stages(self):
+        written = []
+
+        async def split(text):
+            return text.split()
+
+        async def upper(word):
+            return word.upper()
+
+        async def write(word):
+            written.append(word)
+
+        async def run():
+            pipeline = Pipeline([Stage("split", split, expand=True), Stage("upper", upper), Stage("write", write)])
+            for text in ["a b", "c", "d e f"]:
+                await pipeline.put(text)
+            await pipeline.join()
+            # The pipeline can be fed again after a join
+            await pipeline.put("g")
+            await pipeline.join()
+            return pipeline
+
+        pipeline = asyncio.run(run())
+        self.assertEqual(written, ["A", "B", "C", "D", "E", "F", "G"])
+        self.assertEqual([stage.processed for stage in pipeline.stages], [4, 7, 7])
+
+    def test_failures_are_counted_and_dropped(self):
+        written = []
+
+        async def parse(text):
+            return int(text)
+
+        async def write(number):
+            written.append(number)
+
+        async def run():
+            pipeline = Pipeline([Stage("parse", parse, concurrency=4), Stage("write", write, concurrency=2)],
+                                queue_size=2)
+            for text in ["1", "x", "2", "", "3"]:
+                await pipeline.put(text)
+            await pipeline.join()
+            return pipeline
+
+        parse_stage, write_stage = asyncio.run(run()).stages
+        self.assertEqual(sorted(written), [1, 2, 3])
+        self.assertEqual((parse_stage.processed, parse_stage.failed), (3, 2))
+        self.assertEqual((write_stage.processed, write_stage.failed), (3, 0))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_refills_at_quota_rate(self):
+        with mock.patch.object(time, "monotonic", return_value=100.0):
+            bucket = TokenBucket(600, period=60.0)
+            # The burst goes through at once, then tokens come at 600 per minute
+            self.assertEqual(bucket.reserve(60), 0.0)
+            self.assertAlmostEqual(bucket.reserve(10), 1.0)
+            self.assertAlmostEqual(bucket.reserve(10), 2.0)
+
+        # After a long idle time the bucket holds no more than the burst
+        with mock.patch.object(time, "monotonic", return_value=1000.0):
+            self.assertEqual(bucket.reserve(60), 0.0)
+            self.assertAlmostEqual(bucket.reserve(1), 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Firestore allows at most 500 writes in a single batched commit
+MAX_WRITES_PER_BATCH = 500
+
+
+class AsyncBulkWriter:
+    """Buffers Firestore document writes and commits them in batches off the event loop.
+
+    ``set`` only queues the write. Queued writes are committed as one batch once
+    ``max_batch_size`` writes are pending or ``flush_interval`` seconds have
+    passed. Commits run in a worker thread, at most ``max_concurrent_commits``
+    at a time; when all commit slots are busy, ``set`` waits, which gives the
+    producer backpressure. If a batch fails, each of its writes is retried on
+    its own so one bad document doesn't drop the other 499.
+
+    ``set`` and ``delete`` return a future that resolves to True once the write
+    is committed, or False if it failed after retries. Callbacks added to it run
+    before ``close()`` returns.
+
+    Call ``close()`` before exiting to flush whatever is still queued.
+    """
+
+    def __init__(self, db, max_batch_size: int = MAX_WRITES_PER_BATCH, flush_interval: float = 1.0,
+                 max_concurrent_commits: int = 4, max_retries: int = 3):
+        self.db = db
+        self.max_batch_size = min(max_batch_size, MAX_WRITES_PER_BATCH)
+        self.flush_interval = flush_interval
+        self.max_concurrent_commits = max_concurrent_commits
+        self.max_retries = max_retries
+        self.written = 0
+        self.failed = 0
+        self._pending: List[Tuple[Any, Optional[Dict[str, Any]], asyncio.Future]] = []
+        self._commit_slots = None
+        self._flush_handle = None
+        self._tasks = set()
+        self._results = set()
+
+    async def set(self, doc_ref, data: Optional[Dict[str, Any]]) -> asyncio.Future:
+        """Queue ``doc_ref.set(data)`` for the next batch; ``data=None`` deletes the document.
+
+        Returns a future resolving to whether the write was committed.
+        """
+        loop = asyncio.get_running_loop()
+        result = loop.create_future()
+        self._results.add(result)
+        result.add_done_callback(self._results.discard)
+        self._pending.append((doc_ref, data, result))
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush_in_background)
+        return result
+
+    async def delete(self, doc_ref) -> asyncio.Future:
+        """Queue ``doc_ref.delete()`` for the next batch."""
+        return await self.set(doc_ref, None)
+
+    async def flush(self) -> None:
+        """Start committing the queued writes, waiting for a free commit slot."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        writes, self._pending = self._pending, []
+        if not writes:
+            return
+
+        if self._commit_slots is None:
+            self._commit_slots = asyncio.Semaphore(self.max_concurrent_commits)
+        await self._commit_slots.acquire()
+        self._track(asyncio.ensure_future(self._commit(writes)))
+
+    async def close(self) -> None:
+        """Flush the remaining writes and wait for every commit to finish."""
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+        # Done callbacks run in the order they were added, so awaiting the results
+        # last makes sure callers' callbacks have run
+        if self._results:
+            await asyncio.gather(*list(self._results))
+        print(f"Bulk writer finished: {self.written} written, {self.failed} failed")
+
+    def _flush_in_background(self) -> None:
+        self._flush_handle = None
+        self._track(asyncio.ensure_future(self.flush()))
+
+    def _track(self, task) -> None:
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _commit(self, writes: List[Tuple[Any, Optional[Dict[str, Any]], asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        results = [False] * len(writes)
+        try:
+            await loop.run_in_executor(None, self._commit_batch, writes)
+            results = [True] * len(writes)
+            print(f"Committed batch of {len(writes)} documents")
+        except Exception as e:
+            print(f"Error committing batch of {len(writes)} documents, retrying individually: {e}")
+            results = await asyncio.gather(*[
+                loop.run_in_executor(None, self._set_with_retry, doc_ref, data)
+                for doc_ref, data, _ in writes
+            ])
+        finally:
+            self.written += sum(results)
+            self.failed += len(results) - sum(results)
+            for (_, _, result), committed in zip(writes, results):
+                if not result.done():
+                    result.set_result(bool(committed))
+            self._commit_slots.release()
+
+    def _commit_batch(self, writes: List[Tuple[Any, Optional[Dict[str, Any]], asyncio.Future]]) -> None:
+        batch = self.db.batch()
+        for doc_ref, data, _ in writes:
+            if data is None:
+                batch.delete(doc_ref)
+            else:
+                batch.set(doc_ref, data)
+        batch.commit()
+
+    def _set_with_retry(self, doc_ref, data: Optional[Dict[str, Any]]) -> bool:
+        for attempt in range(self.max_retries):
+            try:
+                if data is None:
+                    doc_ref.delete()
+                else:
+                    doc_ref.set(data)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    print(f"Error writing document {doc_ref.id}: {e}")
+                    return False
+                # Exponential backoff with jitter
+                time.sleep((2 ** attempt) * 0.5 + random.uniform(0, 0.5))
+        return False
@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Dict, List, Union
+
+import httpx
+
+
+class CrawlError(Exception):
+    """Raised when a Crawl4AI task fails or does not finish in time."""
+
+
+class Crawl4AIClient:
+    """Async client for the Crawl4AI Docker API.
+
+    All requests share one pooled httpx client with keep-alive connections.
+    Task polling starts with a short delay and backs off towards
+    ``max_poll_interval``, so quick pages come back fast without hammering
+    the server on slow ones.
+    """
+
+    def __init__(self, base_url: str, api_token: str = "", max_connections: int = 20,
+                 initial_poll_interval: float = 0.5, max_poll_interval: float = 10.0,
+                 task_timeout: float = 600.0):
+        headers = {"Authorization": f"Bearer {api_token}"} if api_token else {}
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+        self.initial_poll_interval = initial_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.task_timeout = task_timeout
+
+    async def submit(self, urls: Union[str, List[str]], bypass_cache: bool = True) -> str:
+        """Submit a crawl job for one URL or a batch of URLs and return its task id."""
+        payload = {
+            "urls": urls,
+            "priority": 10,
+            "crawler_params": {
+                "headless": True,
+                "verbose": False
+            },
+            "extra": {
+                "bypass_cache": bypass_cache  # Equivalent to CacheMode.BYPASS
+            }
+        }
+        response = await self.client.post("/crawl", json=payload)
+        response.raise_for_status()
+        return response.json()["task_id"]
+
+    async def wait(self, task_id: str) -> Dict[str, Any]:
+        """Poll a task until it completes and return its status payload."""
+        interval = self.initial_poll_interval
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.task_timeout
+
+        while True:
+            response = await self.client.get(f"/task/{task_id}")
+            response.raise_for_status()
+            status = response.json()
+
+            if status["status"] == "completed":
+                return status
+            if status["status"] == "failed":
+                raise CrawlError(f"Task {task_id} failed: {status.get('error', 'Unknown error')}")
+            if loop.time() + interval > deadline:
+                raise CrawlError(f"Task {task_id} did not complete within {self.task_timeout}s")
+
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, self.max_poll_interval)
+
+    async def crawl(self, url: str) -> Dict[str, Any]:
+        """Crawl a single URL and return its result."""
+        status = await self.wait(await self.submit(url))
+        return status.get("result", {})
+
+    async def crawl_batch(self, urls: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Crawl several URLs as one task; returns results keyed by URL."""
+        status = await self.wait(await self.submit(urls))
+        results = status.get("results") or [status.get("result", {})]
+        return {result.get("url"): result for result in results if result}
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,100 @@
+import asyncio
+from typing import List, Tuple
+
+from google.api_core.exceptions import InvalidArgument
+
+
+# Per-request limits of text-embedding-005 on Vertex AI
+MAX_INSTANCES_PER_REQUEST = 250
+MAX_TOKENS_PER_REQUEST = 20000
+MAX_TOKENS_PER_INSTANCE = 2048  # longer inputs are truncated by the service
+
+# Rough, conservative token estimate; the service rejects batches we underestimate
+# and those are retried in smaller pieces.
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    return min(len(text) // CHARS_PER_TOKEN + 1, MAX_TOKENS_PER_INSTANCE)
+
+
+class EmbeddingBatcher:
+    """Groups concurrent embedding requests into multi-text ``get_embeddings`` calls.
+
+    Callers await ``embed(text)`` as if it were a single request. Pending texts are
+    flushed as one request when the instance or token budget is reached, or after
+    ``max_delay`` seconds, and each caller gets its own vector back. When a
+    ``rate_limiter`` is given, every request waits for quota before it is sent.
+    """
+
+    def __init__(self, embedding_model, max_instances: int = MAX_INSTANCES_PER_REQUEST,
+                 max_tokens: int = MAX_TOKENS_PER_REQUEST, max_delay: float = 0.05,
+                 rate_limiter=None):
+        self.embedding_model = embedding_model
+        self.rate_limiter = rate_limiter
+        self.max_instances = max_instances
+        self.max_tokens = max_tokens
+        self.max_delay = max_delay
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one text as part of the next batch."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = estimate_tokens(text)
+
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+
+        self._pending.append((text, future))
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_instances:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(tokens=sum(estimate_tokens(text) for text in texts))
+        try:
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(
+                None, self.embedding_model.get_embeddings, texts
+            )
+        except InvalidArgument as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # Split the batch so one bad or oversized input only fails itself
+            middle = len(batch) // 2
+            await asyncio.gather(self._run_batch(batch[:middle]), self._run_batch(batch[middle:]))
+            return
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding.values)
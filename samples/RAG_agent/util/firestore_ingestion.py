@@ -4,7 +4,7 @@ import json
 import asyncio
 import requests
 from xml.etree import ElementTree
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import urlparse
@@ -16,6 +16,13 @@ import vertexai
 from vertexai.generative_models import GenerativeModel, GenerationConfig
 from vertexai.language_models import TextEmbeddingModel
 from google.cloud.firestore_v1.vector import Vector
+
+from embedding_batcher import EmbeddingBatcher
+from bulk_writer import AsyncBulkWriter
+from crawl_client import Crawl4AIClient
+from manifest import IngestionManifest, content_hash
+from pipeline import Pipeline, Stage
+from rate_limiter import RateLimiter
 load_dotenv()
 
 # Initialize Firestore client
@@ -28,6 +35,10 @@ load_dotenv()
     # db = firestore.Client()
 db = firestore.Client(database='test-db')
 
+# Write chunks with batched commits instead of one blocking RPC per document
+BULK_WRITES = os.getenv("FIRESTORE_BULK_WRITES", "true").lower() == "true"
+bulk_writer = AsyncBulkWriter(db)
+
 # Initialize Vertex AI
 project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 location = os.getenv("VERTEX_LOCATION", "us-central1")
@@ -37,13 +48,56 @@ vertexai.init(project=project_id, location=location)
 gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-pro")
 gemini_model = GenerativeModel(gemini_model_name)
 
+def gemini_token_counter(model_name: str):
+    """Count prompt tokens with Gemini's local tokenizer, or estimate them if it is unavailable."""
+    try:
+        from vertexai.preview.tokenization import get_tokenizer_for_model
+        tokenizer = get_tokenizer_for_model(model_name)
+    except Exception as e:
+        print(f"No local tokenizer for {model_name}, estimating tokens from characters: {e}")
+        # Gemini averages about 4 characters per token
+        return lambda text: len(text) // 4 + 1
+    return lambda text: tokenizer.count_tokens(text).total_tokens
+
 # Initialize embedding model
 embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-005")
 # embedding_model = VertexAIEmbeddings(model_name="text-embedding-004")
 
+# Rate limiters shared by every Gemini and embedding call in this process.
+# Set these to your project's quotas; the limiters keep requests right under them.
+gemini_limiter = RateLimiter(
+    "gemini",
+    requests_per_minute=float(os.getenv("GEMINI_RPM", "60")),
+    tokens_per_minute=float(os.getenv("GEMINI_TPM", "4000000")),
+    estimate_tokens=gemini_token_counter(gemini_model_name),
+)
+embedding_limiter = RateLimiter(
+    "embedding",
+    requests_per_minute=float(os.getenv("EMBEDDING_RPM", "600")),
+)
+
+# Concurrent get_embedding calls are grouped into multi-text requests
+embedding_batcher = EmbeddingBatcher(embedding_model, rate_limiter=embedding_limiter)
+
+# Firestore collection holding the dbt docs chunks
+COLLECTION_NAME = "dbt_site_pages"
+
+# Manifest of what was already ingested, so re-runs only process changed pages
+# and chunks. Set FULL_REFRESH=true to re-ingest everything regardless.
+MANIFEST_PATH = os.getenv("INGESTION_MANIFEST_PATH", "dbt_ingestion_manifest.json")
+FULL_REFRESH = os.getenv("FULL_REFRESH", "false").lower() == "true"
+manifest = IngestionManifest(MANIFEST_PATH)
+
 # Define the Crawl4AI API endpoint (Docker service)
 CRAWL4AI_API_URL = "http://localhost:11235"
 CRAWL4AI_API_TOKEN = os.getenv("CRAWL4AI_API_TOKEN", "")
+# URLs submitted per Crawl4AI task; 1 submits one task per URL
+CRAWL4AI_BATCH_SIZE = int(os.getenv("CRAWL4AI_BATCH_SIZE", "1"))
+
+# Placeholder summaries used when Gemini fails; chunks with them are re-ingested on the next run
+SUMMARY_EXTRACTION_FAILED = "Summary extraction failed"
+SUMMARY_UNAVAILABLE = "Summary unavailable due to API limits"
+FALLBACK_SUMMARIES = {SUMMARY_EXTRACTION_FAILED, SUMMARY_UNAVAILABLE}
 
 @dataclass
 class ProcessedChunk:
@@ -54,6 +108,8 @@ class ProcessedChunk:
     content: str
     metadata: Dict[str, Any]
     embedding: List[float]
+    # False when the summary or embedding is a fallback placeholder
+    complete: bool = True
 
 def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
     """Split text into chunks, respecting code blocks and paragraphs."""
@@ -100,16 +156,7 @@ def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
 
     return chunks
 
-import time
 import random
-from asyncio import Semaphore, Lock
-
-# Create a rate limiter for Gemini requests
-# Default quota for Gemini 1.5 Pro is 60 requests per minute per project
-# We'll set it to 40 to be safe
-MAX_REQUESTS_PER_MINUTE = 40
-gemini_lock = Lock()  # Use a lock for precise control
-gemini_requests = []  # Track timestamps of requests
 
 async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
     """Extract title and summary using Gemini with strict rate limiting."""
@@ -119,36 +166,14 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
     For the summary: Create a concise summary of the main points in this chunk.
     Keep both title and summary concise but informative."""
     
-    # Implement strict rate limiting
-    async with gemini_lock:
-        current_time = time.time()
-        
-        # Remove timestamps older than 1 minute
-        global gemini_requests
-        gemini_requests = [t for t in gemini_requests if current_time - t < 60]
-        
-        # If we're at or near the limit, wait until we're under the limit
-        if len(gemini_requests) >= MAX_REQUESTS_PER_MINUTE:
-            # Calculate how long to wait - time until oldest request is 60 seconds old plus buffer
-            wait_time = 60 - (current_time - gemini_requests[0]) + 1.0  # Add a 1 second buffer
-            print(f"Rate limit reached ({len(gemini_requests)}/{MAX_REQUESTS_PER_MINUTE}), waiting {wait_time:.2f} seconds before next Gemini request")
-            await asyncio.sleep(wait_time)
-            
-            # Recalculate after waiting
-            current_time = time.time()
-            gemini_requests = [t for t in gemini_requests if current_time - t < 60]
-    
+    prompt = f"{system_prompt}\n\nURL: {url}\n\nContent:\n{chunk[:1000]}..."
+
     # Try to get title and summary with retries
     max_retries = 3
     for retry in range(max_retries):
         try:
-            # Add a small random delay to spread out requests
-            await asyncio.sleep(random.uniform(0.1, 0.5))
-            
-            # Record this request timestamp before making the request
-            async with gemini_lock:
-                gemini_requests.append(time.time())
-                current_count = len(gemini_requests)
+            # Wait for room under both the request and token quotas
+            await gemini_limiter.acquire(text=prompt)
             
             # Create a synchronous function to call Gemini
             def call_gemini():
@@ -160,7 +185,6 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
                     response_mime_type="application/json"
                 )
                 
-                prompt = f"{system_prompt}\n\nURL: {url}\n\nContent:\n{chunk[:1000]}..."
                 response = gemini_model.generate_content(
                     prompt,
                     generation_config=generation_config
@@ -185,14 +209,14 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
                     # If all else fails, create a basic response
                     result = {
                         "title": "Untitled Document Section",
-                        "summary": "Summary extraction failed"
+                        "summary": SUMMARY_EXTRACTION_FAILED
                     }
             
             # Ensure the required keys are present
             if "title" not in result or "summary" not in result:
                 result = {
                     "title": result.get("title", "Untitled Document Section"),
-                    "summary": result.get("summary", "Summary extraction failed")
+                    "summary": result.get("summary", SUMMARY_EXTRACTION_FAILED)
                 }
                 
             return result
@@ -202,6 +226,7 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
             
             # If it's a rate limit error, wait longer
             if "429" in str(e) or "Quota exceeded" in str(e):
+                gemini_limiter.on_quota_exceeded()
                 # Exponential backoff with jitter for rate limit errors
                 backoff_time = (2 ** retry) * 5 + random.uniform(1, 5)
                 print(f"Rate limit exceeded. Backing off for {backoff_time:.2f} seconds")
@@ -214,22 +239,13 @@ async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
             if retry == max_retries - 1:
                 return {
                     "title": f"Document Section from {url.split('/')[-1]}",
-                    "summary": "Summary unavailable due to API limits"
+                    "summary": SUMMARY_UNAVAILABLE
                 }
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from Vertex AI."""
+    """Get embedding vector from Vertex AI, batched with other pending chunks."""
     try:
-        # Create a synchronous function to call the embedding model
-        def call_embedding_model():
-            embeddings = embedding_model.get_embeddings([text])
-            # embeddings = embedding_model.embed_documents([text])
-            # return embeddings
-            return embeddings[0].values
-        
-        # Run the synchronous function in a thread pool
-        loop = asyncio.get_running_loop()
-        embedding = await loop.run_in_executor(None, call_embedding_model)
+        embedding = await embedding_batcher.embed(text)
         
         return embedding
     except Exception as e:
@@ -238,11 +254,16 @@ async def get_embedding(text: str) -> List[float]:
         # Gecko model typically returns 768-dimensional embeddings
         return [0.0] * 768
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
-    """Process a single chunk of text."""
-    # Get title and summary
+async def summarize_chunk(item: Tuple[str, int, str]) -> Tuple[str, int, str, Dict[str, str]]:
+    """Pipeline stage: add the Gemini title and summary to a chunk."""
+    url, chunk_number, chunk = item
     extracted = await get_title_and_summary(chunk, url)
-    
+    return url, chunk_number, chunk, extracted
+
+async def embed_chunk(item: Tuple[str, int, str, Dict[str, str]]) -> ProcessedChunk:
+    """Pipeline stage: embed a summarized chunk."""
+    url, chunk_number, chunk, extracted = item
+
     # Get embedding
     embedding = await get_embedding(chunk)
     
@@ -261,15 +282,27 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
         summary=extracted['summary'],
         content=chunk,  # Store the original chunk content
         metadata=metadata,
-        embedding=embedding
+        embedding=embedding,
+        # get_embedding falls back to a zero vector
+        complete=any(embedding) and extracted['summary'] not in FALLBACK_SUMMARIES
     )
 
-async def insert_chunk(chunk: ProcessedChunk):
-    """Insert a processed chunk into Firestore."""
+async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
+    """Process a single chunk of text."""
+    return await embed_chunk(await summarize_chunk((url, chunk_number, chunk)))
+
+def chunk_doc_id(url: str, chunk_number: int) -> str:
+    """Create a document ID based on URL and chunk number."""
+    safe_url = url.replace("/", "_").replace(".", "_")
+    return f"{safe_url}_{chunk_number}"
+
+async def insert_chunk(chunk: ProcessedChunk) -> Optional[asyncio.Future]:
+    """Insert a processed chunk into Firestore.
+
+    Returns a future resolving to whether the write was committed, or None on error.
+    """
     try:
-        # Create a document ID based on URL and chunk number
-        safe_url = chunk.url.replace("/", "_").replace(".", "_")
-        doc_id = f"{safe_url}_{chunk.chunk_number}"
+        doc_id = chunk_doc_id(chunk.url, chunk.chunk_number)
         
         # Convert the chunk to a dictionary for Firestore
         data = {
@@ -286,116 +319,116 @@ async def insert_chunk(chunk: ProcessedChunk):
         }
         
         # Add to Firestore
-        collection_name = "dbt_site_pages"
-        doc_ref = db.collection(collection_name).document(doc_id)
-        doc_ref.set(data)
-        
+        doc_ref = db.collection(COLLECTION_NAME).document(doc_id)
+        if BULK_WRITES:
+            # Queued and committed in batches by the bulk writer
+            return await bulk_writer.set(doc_ref, data)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, doc_ref.set, data)
         print(f"Inserted chunk {chunk.chunk_number} for {chunk.url}")
-        return doc_id
+        written = loop.create_future()
+        written.set_result(True)
+        return written
     except Exception as e:
         print(f"Error inserting chunk into Firestore: {e}")
         return None
 
-async def process_and_store_document(url: str, markdown: str):
-    """Process a document and store its chunks in parallel with strict rate limiting."""
-    # Split into chunks
+async def delete_chunks(doc_ids: List[str]):
+    """Delete chunk documents that no longer exist in the source."""
+    for doc_id in doc_ids:
+        await bulk_writer.delete(db.collection(COLLECTION_NAME).document(doc_id))
+    if doc_ids:
+        print(f"Deleting {len(doc_ids)} orphaned chunks")
+
+async def split_document(item: Tuple[str, str, Optional[str]]) -> List[Tuple[str, int, str]]:
+    """Pipeline stage: split a crawled document into chunks, keeping only the changed ones."""
+    url, markdown, lastmod = item
     chunks = chunk_text(markdown)
-    print(f"Processing document with {len(chunks)} chunks: {url}")
-    
-    # Process chunks in very small batches to avoid overwhelming the rate limiter
-    batch_size = 5  # Process just 5 chunks at a time
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        
-        # Process current batch in parallel
-        tasks = [
-            process_chunk(chunk, i + j, url) 
-            for j, chunk in enumerate(batch)
-        ]
-        processed_chunks = await asyncio.gather(*tasks)
-        
-        # Store processed chunks
-        insert_tasks = [
-            insert_chunk(chunk) 
-            for chunk in processed_chunks
-        ]
-        await asyncio.gather(*insert_tasks)
-        
-        # Add a delay between batches to respect rate limits
-        if i + batch_size < len(chunks):
-            batch_num = i//batch_size + 1
-            total_batches = (len(chunks) + batch_size - 1)//batch_size
-            print(f"Processed batch {batch_num}/{total_batches} for {url}, waiting before next batch...")
-            # Wait longer between batches to stay well under the limit
-            await asyncio.sleep(5)  # 5 second delay between batches
-
-async def crawl_parallel(urls: List[str], max_concurrent: int = 10):
+
+    doc_ids = [chunk_doc_id(url, i) for i in range(len(chunks))]
+    await delete_chunks(manifest.start_page(url, lastmod, doc_ids))
+
+    changed = [
+        (url, i, chunk)
+        for i, chunk in enumerate(chunks)
+        if FULL_REFRESH or not manifest.chunk_unchanged(url, doc_ids[i], content_hash(chunk))
+    ]
+    print(f"Processing document with {len(changed)}/{len(chunks)} changed chunks: {url}")
+    return changed
+
+async def store_chunk(chunk: ProcessedChunk):
+    """Pipeline stage: write a chunk and record it in the manifest once the write commits.
+
+    Chunks with a fallback summary or embedding are written but not recorded,
+    so the next run processes them again.
+    """
+    written = await insert_chunk(chunk)
+    if written is not None and chunk.complete:
+        doc_id = chunk_doc_id(chunk.url, chunk.chunk_number)
+        manifest.record_when_written(written, chunk.url, doc_id, content_hash(chunk.content))
+    return written
+
+# Documents flow chunk -> summarize -> embed -> write through bounded queues.
+# Each stage has its own workers, so throughput is bounded by the API quotas
+# enforced by the rate limiters rather than by fixed batches.
+ingestion_pipeline = Pipeline([
+    Stage("chunk", split_document, concurrency=1, expand=True),
+    Stage("summarize", summarize_chunk, concurrency=int(os.getenv("SUMMARY_CONCURRENCY", "16"))),
+    Stage("embed", embed_chunk, concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "64"))),
+    Stage("write", store_chunk, concurrency=int(os.getenv("WRITE_CONCURRENCY", "8"))),
+])
+
+async def process_and_store_document(url: str, markdown: str, lastmod: Optional[str] = None):
+    """Queue a document for chunking, summarizing, embedding and storing."""
+    await ingestion_pipeline.put((url, markdown, lastmod))
+
+async def crawl_parallel(urls: List[str], max_concurrent: int = 10, lastmods: Optional[Dict[str, str]] = None):
     """Crawl multiple URLs in parallel with a concurrency limit using the Crawl4AI Docker API."""
     # Create a semaphore to limit concurrency
     semaphore = asyncio.Semaphore(max_concurrent)
-    
-    # Setup headers for API authentication if token is provided
-    headers = {"Authorization": f"Bearer {CRAWL4AI_API_TOKEN}"} if CRAWL4AI_API_TOKEN else {}
-    
+    lastmods = lastmods or {}
+    client = Crawl4AIClient(CRAWL4AI_API_URL, CRAWL4AI_API_TOKEN, max_connections=max_concurrent)
+
+    async def handle_result(url: str, result: Dict[str, Any]):
+        if result.get("success", False):
+            print(f"Successfully crawled: {url}")
+            # Extract the markdown content
+            await process_and_store_document(url, result["markdown"], lastmods.get(url))
+        else:
+            print(f"Failed: {url} - Error: {result.get('error_message', 'Unknown error')}")
+
     async def process_url(url: str):
         async with semaphore:
-            # Prepare the request payload for the Docker API
-            payload = {
-                "urls": url,
-                "priority": 10,
-                "crawler_params": {
-                    "headless": True,
-                    "verbose": False
-                },
-                "extra": {
-                    "bypass_cache": True  # Equivalent to CacheMode.BYPASS
-                }
-            }
-            
             try:
-                # Submit the crawl job to the Docker API
-                response = requests.post(
-                    f"{CRAWL4AI_API_URL}/crawl",
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                task_id = response.json()["task_id"]
-                print(f"Submitted task for URL: {url}, Task ID: {task_id}")
-                
-                # Poll for the result
-                while True:
-                    result_response = requests.get(
-                        f"{CRAWL4AI_API_URL}/task/{task_id}",
-                        headers=headers
-                    )
-                    result_response.raise_for_status()
-                    status = result_response.json()
-                    
-                    if status["status"] == "completed":
-                        if status.get("result", {}).get("success", False):
-                            print(f"Successfully crawled: {url}")
-                            # Extract the markdown content
-                            markdown = status["result"]["markdown"]
-                            await process_and_store_document(url, markdown)
-                        else:
-                            print(f"Failed: {url} - Error: {status.get('result', {}).get('error_message', 'Unknown error')}")
-                        break
-                    elif status["status"] == "failed":
-                        print(f"Failed: {url} - Task failed")
-                        break
-                    
-                    # Wait before polling again
-                    await asyncio.sleep(10)
-                    
+                result = await client.crawl(url)
             except Exception as e:
                 print(f"Error processing URL {url}: {e}")
-    
-    # Process all URLs in parallel with limited concurrency
-    await asyncio.gather(*[process_url(url) for url in urls])
+                return
+        await handle_result(url, result)
 
-def get_pydantic_ai_docs_urls() -> List[str]:
-    """Get URLs from Pydantic AI docs sitemap."""
+    async def process_batch(batch: List[str]):
+        async with semaphore:
+            try:
+                results = await client.crawl_batch(batch)
+            except Exception as e:
+                print(f"Error processing batch of {len(batch)} URLs: {e}")
+                return
+        for url in batch:
+            await handle_result(url, results.get(url, {"error_message": "Missing from batch result"}))
+
+    try:
+        if CRAWL4AI_BATCH_SIZE > 1:
+            # Let Crawl4AI crawl several URLs per task
+            batches = [urls[i:i + CRAWL4AI_BATCH_SIZE] for i in range(0, len(urls), CRAWL4AI_BATCH_SIZE)]
+            await asyncio.gather(*[process_batch(batch) for batch in batches])
+        else:
+            # Process all URLs in parallel with limited concurrency
+            await asyncio.gather(*[process_url(url) for url in urls])
+    finally:
+        await client.aclose()
+
+def get_sitemap_entries() -> Dict[str, Optional[str]]:
+    """Get URLs and their <lastmod> dates from the docs sitemap."""
     sitemap_url = "https://docs.getdbt.com/sitemap.xml"
     try:
         response = requests.get(sitemap_url)
@@ -406,22 +439,45 @@ def get_pydantic_ai_docs_urls() -> List[str]:
         
         # Extract all URLs from the sitemap
         namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-        urls = [loc.text for loc in root.findall('.//ns:loc', namespace)]
+        entries = {}
+        for url_element in root.findall('.//ns:url', namespace):
+            loc = url_element.findtext('ns:loc', namespaces=namespace)
+            if loc:
+                entries[loc] = url_element.findtext('ns:lastmod', namespaces=namespace)
         
-        return urls
+        return entries
     except Exception as e:
         print(f"Error fetching sitemap: {e}")
-        return []
+        return {}
+
+def get_pydantic_ai_docs_urls() -> List[str]:
+    """Get URLs from Pydantic AI docs sitemap."""
+    return list(get_sitemap_entries())
 
 async def main():
     # Get URLs from Pydantic AI docs
-    urls = get_pydantic_ai_docs_urls()
-    if not urls:
+    entries = get_sitemap_entries()
+    if not entries:
         print("No URLs found to crawl")
         return
-    
-    print(f"Found {len(urls)} URLs to crawl")
-    await crawl_parallel(urls)
+
+    # Pages that left the sitemap take their chunks with them
+    for url in manifest.urls():
+        if url not in entries:
+            await delete_chunks(manifest.remove_page(url))
+
+    urls = [
+        url for url, lastmod in entries.items()
+        if FULL_REFRESH or not manifest.page_unchanged(url, lastmod)
+    ]
+    print(f"Found {len(entries)} URLs, {len(urls)} new or changed to crawl")
+    try:
+        await crawl_parallel(urls, lastmods=entries)
+        await ingestion_pipeline.join()
+        await bulk_writer.close()
+    finally:
+        manifest.save()
+    print(f"Rate limiter usage: {gemini_limiter.stats()} {embedding_limiter.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
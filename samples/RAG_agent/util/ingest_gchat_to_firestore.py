@@ -2,7 +2,7 @@ from google.api_core.exceptions import InvalidArgument
 import json
 import os
 import asyncio
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from dotenv import load_dotenv
@@ -13,6 +13,13 @@ import vertexai
 from vertexai.generative_models import GenerativeModel, GenerationConfig
 from vertexai.language_models import TextEmbeddingModel
 from google.cloud.firestore_v1.vector import Vector
+
+from embedding_batcher import EmbeddingBatcher
+from bulk_writer import AsyncBulkWriter
+from json_stream import iter_json_records
+from manifest import IngestionManifest
+from pipeline import Pipeline, Stage
+from rate_limiter import RateLimiter
 load_dotenv()
 
 @dataclass
@@ -22,6 +29,9 @@ class ProcessedChunk:
     content: str
     metadata: Dict[str, Any]
     embedding: List[float]
+    # Manifest key of the message, and its version when it was read
+    name: str = ""
+    version: Optional[str] = None
 
 # def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
 #     """Split text into chunks, respecting code blocks and paragraphs."""
@@ -69,18 +79,9 @@ class ProcessedChunk:
 #     return chunks
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from Vertex AI."""
+    """Get embedding vector from Vertex AI, batched with other pending chunks."""
     try:
-        # Create a synchronous function to call the embedding model
-        def call_embedding_model():
-            embeddings = embedding_model.get_embeddings([text])
-            # embeddings = embedding_model.embed_documents([text])
-            # return embeddings
-            return embeddings[0].values
-        
-        # Run the synchronous function in a thread pool
-        loop = asyncio.get_running_loop()
-        embedding = await loop.run_in_executor(None, call_embedding_model)
+        embedding = await embedding_batcher.embed(text)
         
         return embedding
     except InvalidArgument as e:
@@ -95,12 +96,18 @@ async def get_embedding(text: str) -> List[float]:
         return [0.0] * 768
 
 
-async def insert_chunk(chunk: ProcessedChunk):
-    """Insert a processed chunk into Firestore."""
+def message_doc_id(url: str, msg_number: int) -> str:
+    """Create a document ID based on URL and message number."""
+    safe_url = url.replace("/", "_").replace(".", "_")
+    return f"{safe_url}_{msg_number}"
+
+async def insert_chunk(chunk: ProcessedChunk) -> Optional[asyncio.Future]:
+    """Insert a processed chunk into Firestore.
+
+    Returns a future resolving to whether the write was committed, or None on error.
+    """
     try:
-        # Create a document ID based on URL and chunk number
-        safe_url = chunk.url.replace("/", "_").replace(".", "_")
-        doc_id = f"{safe_url}_{chunk.chunk_number}"
+        doc_id = message_doc_id(chunk.url, chunk.chunk_number)
         
         # Convert the chunk to a dictionary for Firestore
         data = {
@@ -116,20 +123,47 @@ async def insert_chunk(chunk: ProcessedChunk):
         # Add to Firestore
         collection_name = "gchat_messages_v2"
         doc_ref = db.collection(collection_name).document(doc_id)
-        doc_ref.set(data)
-        
+        if BULK_WRITES:
+            # Queued and committed in batches by the bulk writer
+            return await bulk_writer.set(doc_ref, data)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, doc_ref.set, data)
         print(f"Inserted chunk {chunk.chunk_number} for {chunk.url}")
-        return doc_id
+        written = loop.create_future()
+        written.set_result(True)
+        return written
     except Exception as e:
         print(f"Error inserting chunk into Firestore: {e}")
         return None
 
+async def store_message(chunk: ProcessedChunk):
+    """Pipeline stage: write a message and record it in the manifest once the write commits.
+
+    Messages with a fallback embedding are written but not recorded, so the next run embeds them again.
+    """
+    written = await insert_chunk(chunk)
+    if written is not None and chunk.name and chunk.embedding and any(chunk.embedding):
+        doc_id = message_doc_id(chunk.url, chunk.chunk_number)
+        manifest.record_when_written(written, chunk.name, doc_id, chunk.version or "")
+    return written
+
 # Initialize Firestore client
 db = firestore.Client(
     project='joon-sandbox',
     database='test-db'
 )
 
+# Write chunks with batched commits instead of one blocking RPC per document
+BULK_WRITES = os.getenv("FIRESTORE_BULK_WRITES", "true").lower() == "true"
+bulk_writer = AsyncBulkWriter(db)
+
+# Manifest of the messages already ingested, keyed on the message name, so
+# re-runs over the appended export only embed new or edited messages.
+# Set FULL_REFRESH=true to re-ingest everything regardless.
+MANIFEST_PATH = os.getenv("GCHAT_MANIFEST_PATH", "gchat_ingestion_manifest.json")
+FULL_REFRESH = os.getenv("FULL_REFRESH", "false").lower() == "true"
+manifest = IngestionManifest(MANIFEST_PATH)
+
 # Initialize Vertex AI
 # project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 # location = os.getenv("VERTEX_LOCATION", "us-central1")
@@ -144,6 +178,15 @@ gemini_model = GenerativeModel(gemini_model_name)
 # Initialize embedding model
 embedding_model = TextEmbeddingModel.from_pretrained("text-embedding-005")
 
+# Keep embedding requests right under the project's quota
+embedding_limiter = RateLimiter(
+    "embedding",
+    requests_per_minute=float(os.getenv("EMBEDDING_RPM", "600")),
+)
+
+# Concurrent get_embedding calls are grouped into multi-text requests
+embedding_batcher = EmbeddingBatcher(embedding_model, rate_limiter=embedding_limiter)
+
 async def process_gchat_message(message: Dict[str, Any], msg_number: int) -> ProcessedChunk:
     """Process a single chat message."""
     # Combine relevant message fields for embedding
@@ -171,43 +214,49 @@ async def process_gchat_message(message: Dict[str, Any], msg_number: int) -> Pro
         chunk_number=msg_number,
         content=message_text,
         metadata=metadata,
-        embedding=embedding
+        embedding=embedding,
+        name=message.get('name', ''),
+        version=message_version(message)
     )
 
+def message_version(message: Dict[str, Any]) -> Optional[str]:
+    """Edits bump lastUpdateTime, so an edited message counts as changed."""
+    return message.get('lastUpdateTime') or message.get('createTime')
+
+async def embed_message(item: Tuple[Dict[str, Any], int]) -> ProcessedChunk:
+    """Pipeline stage: embed a chat message."""
+    message, msg_number = item
+    return await process_gchat_message(message, msg_number)
+
+# Messages flow embed -> write through bounded queues; the embedding batcher
+# groups the concurrent embed workers into multi-text requests.
+ingestion_pipeline = Pipeline([
+    Stage("embed", embed_message, concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "64"))),
+    Stage("write", store_message, concurrency=int(os.getenv("WRITE_CONCURRENCY", "8"))),
+])
+
 async def process_gchat_file(filepath: str):
-    """Process the entire gchat.json file."""
+    """Process a gchat.json array or gchat.ndjson export, streaming it message by message."""
     try:
-        # Load JSON file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            messages = json.load(f)
+        print(f"Processing messages from {filepath}")
         
-        print(f"Processing {len(messages)} messages from {filepath}")
-        
-        # Process messages in small batches (similar to original code)
-        batch_size = 5
-        for i in range(0, len(messages), batch_size):
-            batch = messages[i:i+batch_size]
-            
-            # Process current batch
-            tasks = [
-                process_gchat_message(msg, i + j) 
-                for j, msg in enumerate(batch)
-            ]
-            processed_chunks = await asyncio.gather(*tasks)
-            
-            # Store processed chunks
-            insert_tasks = [
-                insert_chunk(chunk) 
-                for chunk in processed_chunks
-            ]
-            await asyncio.gather(*insert_tasks)
-            
-            # Progress update
-            print(f"Processed messages {i} to {min(i+batch_size, len(messages))}")
-            
-            # Add delay between batches to respect rate limits
-            if i + batch_size < len(messages):
-                await asyncio.sleep(2)
+        # Messages are read lazily and stream through the embed and write stages,
+        # so memory stays flat regardless of the export size
+        count = 0
+        skipped = 0
+        for i, msg in enumerate(iter_json_records(filepath)):
+            name = msg.get('name', '')
+            if name and not FULL_REFRESH and manifest.page_unchanged(name, message_version(msg)):
+                skipped += 1
+                continue
+            if name:
+                doc_id = message_doc_id(msg.get('uri', ''), i)
+                for orphan in manifest.start_page(name, message_version(msg), [doc_id]):
+                    await bulk_writer.delete(db.collection("gchat_messages_v2").document(orphan))
+            await ingestion_pipeline.put((msg, i))
+            count += 1
+        await ingestion_pipeline.join()
+        print(f"Processed {count} messages from {filepath}, {skipped} unchanged skipped")
     except FileNotFoundError:
         print(f"Error: Could not find file {filepath}")
     except json.JSONDecodeError:
@@ -217,8 +266,13 @@ async def process_gchat_file(filepath: str):
 
 
 async def main():
-    filepath = "gchat.json"  # Adjust path as needed
-    await process_gchat_file(filepath)
+    filepath = os.getenv("GCHAT_EXPORT_PATH", "gchat.ndjson")  # .ndjson or a .json array
+    try:
+        await process_gchat_file(filepath)
+        await bulk_writer.close()
+    finally:
+        manifest.save()
+    print(f"Rate limiter usage: {embedding_limiter.stats()}")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+from typing import Any, Dict, Iterator, TextIO
+
+
+READ_SIZE = 1 << 16
+
+
+def iter_ndjson(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield one object per non-empty line."""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield the elements of a top-level JSON array of objects without loading it whole.
+
+    Only the element being decoded and one read buffer are held in memory, which
+    keeps exports written by ``ChatExtractor.dump_json`` readable at any size.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+
+    def read_more() -> bool:
+        nonlocal buffer, eof
+        data = f.read(READ_SIZE)
+        if not data:
+            eof = True
+        buffer += data
+        return bool(data)
+
+    # Find the opening bracket
+    while not buffer.lstrip():
+        if not read_more():
+            return
+    buffer = buffer.lstrip()
+    if not buffer.startswith("["):
+        raise json.JSONDecodeError("Expected a JSON array", buffer, 0)
+    buffer = buffer[1:]
+
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if not buffer:
+            if not read_more():
+                raise json.JSONDecodeError("Unterminated JSON array", buffer, 0)
+            continue
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # The element is cut off at the end of the buffer, read more of it
+            if eof or not read_more():
+                raise
+            continue
+        if not eof and not buffer[end:].lstrip().startswith((",", "]")):
+            # A scalar can decode from a prefix, e.g. 12 from 12|345; read until the element is delimited
+            read_more()
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_json_records(filepath: str) -> Iterator[Dict[str, Any]]:
+    """Stream records from a .ndjson/.jsonl file or a JSON array file."""
+    with open(filepath, "r", encoding="utf-8") as f:
+        if filepath.endswith((".ndjson", ".jsonl")):
+            yield from iter_ndjson(f)
+        else:
+            yield from iter_json_array(f)
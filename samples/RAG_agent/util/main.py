@@ -3,6 +3,10 @@ from __future__ import print_function
 import os.path
 
 import json 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Iterable, Iterator, Optional
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -12,6 +16,9 @@ from google.protobuf.json_format import MessageToJson, MessageToDict
 from google.apps.chat_v1 import Message
 import sys
 
+# Largest page size the Chat API accepts for messages and spaces
+PAGE_SIZE = 1000
+
 # If modifying these scopes, delete the file token.json.
 SCOPES = [
     'https://www.googleapis.com/auth/chat.spaces.readonly',
@@ -19,6 +26,17 @@ SCOPES = [
     ]
 
 
+def parse_create_time(value: str) -> tuple:
+    """
+    Parses an RFC 3339 createTime into a comparable (datetime, nanoseconds) key.
+    The API drops trailing zeros, so the fraction has 0, 3, 6 or 9 digits and the
+    strings don't compare in time order.
+    """
+    seconds, _, fraction = value.rstrip('Z').partition('.')
+    parsed = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+    return parsed, int(fraction.ljust(9, '0')[:9])
+
+
 class EnrichedMessage:
     def __init__(self, original_message: Message):
         self.original = original_message
@@ -45,6 +63,7 @@ class ChatExtractor():
         self.client: google_chat.ChatServiceClient
         self.space_ids = []
         self.creds = None
+        self._lock = Lock()  # guards the output file and checkpoints across spaces
         self._init_oauth()
 
 
@@ -95,7 +114,8 @@ class ChatExtractor():
         # Initialize request argument(s)
         request = google_chat.ListSpacesRequest(
             # Filter spaces by space type (SPACE or GROUP_CHAT or DIRECT_MESSAGE)
-            filter = 'space_type = "SPACE"'
+            filter = 'space_type = "SPACE"',
+            page_size = PAGE_SIZE
         )
 
         # Make the request
@@ -107,26 +127,126 @@ class ChatExtractor():
         return spaces
 
 
-    def list_messages(self, space_id: str) -> list[dict]:
+    def iter_messages(self, space_id: str) -> Iterator[dict]:
+        """Yield the messages of a space one at a time, fetching pages lazily."""
         request = google_chat.ListMessagesRequest(
             parent=space_id
         )
         results = self.client.list_messages(request)
 
         # Convert each protobuf message to a dict properly
-        messages = [ EnrichedMessage(message).data for message in results ]
+        for message in results:
+            yield EnrichedMessage(message).data
 
-        return messages
+    def list_messages(self, space_id: str) -> list[dict]:
+        return list(self.iter_messages(space_id))
 
     def dump_json(self, content, output_file :str) -> None:
         with open(output_file, 'w') as f:
             json.dump(content, f, indent=4)
 
+    def _load_checkpoints(self, checkpoint_file: str) -> dict:
+        if os.path.exists(checkpoint_file):
+            with open(checkpoint_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_checkpoints(self, checkpoints: dict, checkpoint_file: str) -> None:
+        tmp_file = checkpoint_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(checkpoints, f, indent=4)
+        os.replace(tmp_file, checkpoint_file)
+
+    def extract_space(self, space_id: str, out, checkpoints: dict, checkpoint_file: str) -> int:
+        """
+        Fetches the new messages of one space page by page, appending them to ``out``.
+
+        After every page the page token and the latest createTime are checkpointed,
+        so an interrupted run resumes from the last page it wrote, and a completed
+        space is only asked for messages newer than the last one it saw.
+        """
+        checkpoint = checkpoints.get(space_id, {})
+        last_create_time = checkpoint.get('last_create_time')
+        page_token = checkpoint.get('page_token', '')
+        # A page token is only valid together with the filter it was issued for,
+        # so an interrupted run keeps the filter it started with
+        if page_token:
+            message_filter = checkpoint['filter']
+        else:
+            message_filter = f'create_time > "{last_create_time}"' if last_create_time else ''
+
+        count = 0
+        while True:
+            request = google_chat.ListMessagesRequest(
+                parent=space_id,
+                page_size=PAGE_SIZE,
+                page_token=page_token,
+                filter=message_filter
+            )
+            page = next(iter(self.client.list_messages(request).pages))
+
+            messages = [ EnrichedMessage(message).data for message in page.messages ]
+            for message in messages:
+                create_time = message.get('createTime')
+                if create_time and (not last_create_time
+                                    or parse_create_time(create_time) > parse_create_time(last_create_time)):
+                    last_create_time = create_time
+            page_token = page.next_page_token
+            count += len(messages)
+
+            with self._lock:
+                for message in messages:
+                    out.write(json.dumps(message) + '\n')
+                out.flush()
+                checkpoints[space_id] = {'last_create_time': last_create_time}
+                if page_token:
+                    checkpoints[space_id].update(page_token=page_token, filter=message_filter)
+                self._save_checkpoints(checkpoints, checkpoint_file)
+
+            if not page_token:
+                print(f"Fetched {count} new messages from {space_id}")
+                return count
+
+    def extract_spaces(self, output_file: str, space_ids: Optional[list[str]] = None,
+                       checkpoint_file: str = 'chat_checkpoints.json', max_workers: int = 4) -> int:
+        """
+        Extracts the new messages of several spaces concurrently into one NDJSON file.
+
+        Defaults to every space returned by ``list_spaces``. Messages are appended, so
+        pages written before an interruption are kept and the run picks up after them.
+        """
+        if space_ids is None:
+            space_ids = [ space['name'] for space in self.list_spaces() ]
+
+        checkpoints = self._load_checkpoints(checkpoint_file)
+        total = 0
+        with open(output_file, 'a', encoding='utf-8') as out, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.extract_space, space_id, out, checkpoints, checkpoint_file): space_id
+                for space_id in space_ids
+            }
+            for future in as_completed(futures):
+                try:
+                    total += future.result()
+                except Exception as e:
+                    print(f"Error extracting {futures[future]}: {e}")
+        return total
+
+    def dump_ndjson(self, messages: Iterable[dict], output_file: str) -> int:
+        """Write one JSON message per line, so neither side holds the whole export in memory."""
+        count = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message) + '\n')
+                count += 1
+        return count
+
 
 
 # ONE - Q&A on System Activity pipeline
 target_space = 'spaces/AAAAocwPEic'
 
 chatter = ChatExtractor()
-chats = chatter.list_messages(target_space)
-chatter.dump_json(chats,'tmp.json')
+# Re-running only fetches messages newer than the last run; pass space_ids=None for every space
+chatter.extract_spaces('gchat.ndjson', space_ids=[target_space])
@@ -0,0 +1,80 @@
+import os
+import json
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class IngestionManifest:
+    """Records what has been ingested per URL so re-runs only process the delta.
+
+    For every page the manifest keeps the sitemap ``lastmod`` it was crawled at,
+    the chunk document ids it currently produces, and the content hash of each
+    chunk that made it to Firestore. A page is only skipped when its lastmod is
+    unchanged and all of its chunks were written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pages: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.pages = json.load(f)
+
+    def save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.pages, f)
+        os.replace(tmp_path, self.path)
+
+    def urls(self) -> List[str]:
+        return list(self.pages)
+
+    def page_unchanged(self, url: str, lastmod: Optional[str]) -> bool:
+        """Whether the page was fully ingested at this lastmod and can be skipped."""
+        page = self.pages.get(url)
+        if not page or not lastmod or page["lastmod"] != lastmod:
+            return False
+        return all(doc_id in page["chunks"] for doc_id in page["doc_ids"])
+
+    def start_page(self, url: str, lastmod: Optional[str], doc_ids: List[str]) -> List[str]:
+        """Set the chunks a freshly crawled page produces; returns orphaned doc ids to delete."""
+        page = self.pages.setdefault(url, {"lastmod": None, "doc_ids": [], "chunks": {}})
+        orphans = [doc_id for doc_id in page["chunks"] if doc_id not in doc_ids]
+        for doc_id in orphans:
+            del page["chunks"][doc_id]
+        page["lastmod"] = lastmod
+        page["doc_ids"] = doc_ids
+        return orphans
+
+    def chunk_unchanged(self, url: str, doc_id: str, chunk_hash: str) -> bool:
+        page = self.pages.get(url)
+        return bool(page) and page["chunks"].get(doc_id) == chunk_hash
+
+    def record_chunk(self, url: str, doc_id: str, chunk_hash: str) -> None:
+        page = self.pages.get(url)
+        if page is not None:
+            page["chunks"][doc_id] = chunk_hash
+
+    def record_when_written(self, written: asyncio.Future, url: str, doc_id: str, chunk_hash: str) -> None:
+        """Record a chunk once its write future resolves to True.
+
+        Failed writes are left out of the manifest, so the next run retries them.
+        """
+        def record(future: asyncio.Future) -> None:
+            if not future.cancelled() and future.exception() is None and future.result():
+                self.record_chunk(url, doc_id, chunk_hash)
+
+        if written.done():
+            record(written)
+        else:
+            written.add_done_callback(record)
+
+    def remove_page(self, url: str) -> List[str]:
+        """Forget a page that left the sitemap; returns its doc ids to delete."""
+        page = self.pages.pop(url, None)
+        return list(page["chunks"]) if page else []
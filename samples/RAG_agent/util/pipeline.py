@@ -0,0 +1,91 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+# Marks the end of the stream for the workers of a stage
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    """One step of the pipeline.
+
+    ``fn`` is an async function applied to every item by ``concurrency`` workers.
+    Returning None drops the item. With ``expand=True`` the function returns a list
+    and each element is passed on separately, e.g. a document split into chunks.
+    """
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]
+    concurrency: int = 1
+    expand: bool = False
+    processed: int = field(default=0, init=False)
+    failed: int = field(default=0, init=False)
+
+
+class Pipeline:
+    """Runs items through a chain of stages connected by bounded queues.
+
+    Every stage works on its own items concurrently with the others, so a slow
+    item only occupies one worker instead of stalling a whole batch. When a
+    downstream queue is full, upstream workers wait, which keeps memory bounded.
+
+    Usage:
+        pipeline = Pipeline([Stage("embed", embed, 32), Stage("write", write, 8)])
+        for item in items:
+            await pipeline.put(item)
+        await pipeline.join()
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 100):
+        self.stages = stages
+        self.queue_size = queue_size
+        self._queues: Optional[List[asyncio.Queue]] = None
+        self._workers: List[List[asyncio.Task]] = []
+
+    def start(self) -> None:
+        """Create the queues and workers on the running event loop."""
+        if self._queues is not None:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        for i, stage in enumerate(self.stages):
+            output = self._queues[i + 1] if i + 1 < len(self.stages) else None
+            self._workers.append([
+                asyncio.ensure_future(self._work(stage, self._queues[i], output))
+                for _ in range(stage.concurrency)
+            ])
+
+    async def put(self, item: Any) -> None:
+        """Feed an item to the first stage, waiting if the pipeline is full."""
+        self.start()
+        await self._queues[0].put(item)
+
+    async def join(self) -> None:
+        """Wait for every item fed so far to go through all the stages."""
+        self.start()
+        for queue, stage, workers in zip(self._queues, self.stages, self._workers):
+            # Once every worker of a stage got its end marker, nothing more reaches the next one
+            for _ in workers:
+                await queue.put(_DONE)
+            await asyncio.gather(*workers)
+            print(f"Stage {stage.name}: {stage.processed} processed, {stage.failed} failed")
+        self._queues = None
+        self._workers = []
+
+    async def _work(self, stage: Stage, queue: asyncio.Queue, output: Optional[asyncio.Queue]) -> None:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            try:
+                result = await stage.fn(item)
+                stage.processed += 1
+            except Exception as e:
+                stage.failed += 1
+                print(f"Error in stage {stage.name}: {e}")
+                continue
+
+            if output is None or result is None:
+                continue
+            for out in (result if stage.expand else [result]):
+                await output.put(out)
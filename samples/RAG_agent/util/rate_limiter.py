@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """A token bucket that admits at most ``limit`` tokens in any ``period`` seconds.
+
+    The bucket refills at ``limit / period``, so steady traffic can use the
+    whole quota, and holds at most ``burst`` tokens, so idle time only buys a
+    small burst. Callers reserve tokens up
+    front, letting the level go negative, and then sleep for their share of the
+    deficit. Reservations are therefore served in order and nobody holds a lock
+    while waiting.
+    """
+
+    def __init__(self, limit: float, period: float = 60.0, burst_fraction: float = 0.1):
+        self.limit = limit
+        self.burst = max(1.0, limit * burst_fraction)
+        self.rate = limit / period
+        self.level = self.burst
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.burst, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return how long to wait before using them."""
+        now = time.monotonic()
+        self._refill(now)
+        # A single oversized request is clamped so it can still go through eventually
+        self.level -= min(amount, self.limit)
+        return max(0.0, -self.level / self.rate)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the server reported a quota error."""
+        self._refill(time.monotonic())
+        self.level = min(self.level, 0.0)
+
+    def utilization(self) -> float:
+        """Fraction of the bucket in use; above 1.0 means callers are queued."""
+        self._refill(time.monotonic())
+        return 1.0 - self.level / self.burst
+
+
+class RateLimiter:
+    """Async limiter for an API quota with requests-per-minute and tokens-per-minute limits.
+
+    ``estimate_tokens`` counts the tokens of a text the way the model behind the
+    quota does, for callers that pass ``text`` instead of a token count.
+
+    Usage:
+        limiter = RateLimiter("gemini", requests_per_minute=60, tokens_per_minute=1_000_000,
+                              estimate_tokens=count_gemini_tokens)
+        await limiter.acquire(text=prompt)
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: Optional[float] = None,
+                 estimate_tokens: Optional[Callable[[str], int]] = None):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.estimate_tokens = estimate_tokens
+        self.total_requests = 0
+        self.total_wait = 0.0
+
+    async def acquire(self, tokens: float = 0, text: Optional[str] = None) -> None:
+        """Wait until one request carrying ``tokens`` tokens, or those of ``text``, fits in both quotas."""
+        if text is not None and self.estimate_tokens is not None:
+            tokens = self.estimate_tokens(text)
+        wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+
+        self.total_requests += 1
+        if wait > 0:
+            self.total_wait += wait
+            await asyncio.sleep(wait)
+
+    def on_quota_exceeded(self) -> None:
+        """Stop issuing new requests until the buckets have refilled."""
+        self.requests.drain()
+        if self.tokens is not None:
+            self.tokens.drain()
+
+    def stats(self) -> dict:
+        """Report how saturated the limiter is."""
+        return {
+            "name": self.name,
+            "requests": self.total_requests,
+            "total_wait_seconds": round(self.total_wait, 2),
+            "rpm_utilization": round(self.requests.utilization(), 3),
+            "tpm_utilization": round(self.tokens.utilization(), 3) if self.tokens else None,
+        }
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import threading
+from typing import List, Dict, Any, Iterable, Tuple
+
+import numpy as np
+
+
+# Default location of the on-disk index, next to the agent package
+DEFAULT_INDEX_DIR = os.getenv(
+    "RAG_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vector_index"),
+)
+
+# Dimension of text-embedding-005 vectors
+EMBEDDING_DIM = 768
+
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCS_FILE = "docs.json"
+INT8_CODES_FILE = "embeddings.int8.npy"
+INT8_SCALES_FILE = "scales.npy"
+BINARY_CODES_FILE = "embeddings.bits.npy"
+
+# How vectors are held in memory for the scan: "none" (float32), "int8" (4x smaller) or "binary" (32x smaller)
+INDEX_QUANTIZATION = os.getenv("RAG_INDEX_QUANTIZATION", "none")
+
+# Quantized scans shortlist this many candidates, which are then rescored with the float vectors
+RESCORE_CANDIDATES = int(os.getenv("RAG_INDEX_RESCORE_CANDIDATES", "100"))
+
+# Rows scanned per block, bounding the temporary memory a quantized scan needs
+SCAN_BLOCK_ROWS = 16384
+
+# Number of set bits in every byte value, for Hamming distances between packed sign bits
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def quantize_int8(embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization; returns the codes and their float scales."""
+    scales = np.abs(embeddings).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(embeddings: np.ndarray) -> np.ndarray:
+    """Keep one sign bit per dimension, packed 8 to a byte."""
+    return np.packbits(embeddings > 0, axis=-1)
+
+
+class LocalVectorIndex:
+    """In-process vector index over the embeddings stored in Firestore.
+
+    Vectors live in a float32 .npy file that is memory-mapped on load, so the
+    OS page cache is shared across worker processes. Search is an exact
+    Euclidean scan, matching the ``DistanceMeasure.EUCLIDEAN`` ranking that
+    ``find_nearest`` uses.
+
+    With ``quantization`` set to "int8" or "binary", the scan runs over compact
+    in-memory codes instead and only the best ``RESCORE_CANDIDATES`` are
+    rescored exactly, so only their float rows are ever paged in.
+    """
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, dim: int = EMBEDDING_DIM,
+                 quantization: str = INDEX_QUANTIZATION):
+        if quantization not in ("none", "int8", "binary"):
+            raise ValueError(f"Unknown quantization {quantization!r}, expected none, int8 or binary")
+        self.index_dir = index_dir
+        self.dim = dim
+        self.quantization = quantization
+        self.embeddings = np.zeros((0, dim), dtype=np.float32)
+        self.sq_norms = np.zeros(0, dtype=np.float32)
+        self.codes = None
+        self.scales = None
+        self.docs: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.built_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def vector(self, doc_id: str):
+        """Return the float vector of a document, or None if it isn't indexed."""
+        embeddings, rows = self.embeddings, self.rows
+        row = rows.get(doc_id)
+        return None if row is None else np.asarray(embeddings[row])
+
+    def build(self, records: Iterable[Tuple[Dict[str, Any], List[float]]]) -> None:
+        """Build the index from (doc, embedding) pairs and persist it to disk."""
+        docs = []
+        vectors = []
+        for doc, embedding in records:
+            if embedding is None or len(embedding) != self.dim:
+                continue
+            docs.append(doc)
+            vectors.append(embedding)
+
+        embeddings = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._save(docs, embeddings)
+        self.load()
+
+    def load(self) -> bool:
+        """Memory-map a previously saved index. Returns False if none exists."""
+        embeddings_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        docs_path = os.path.join(self.index_dir, DOCS_FILE)
+        if not (os.path.exists(embeddings_path) and os.path.exists(docs_path)):
+            return False
+
+        with open(docs_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        codes, scales = self._load_codes(embeddings)
+        if self.quantization == "int8":
+            # Squared norms of the dequantized vectors, consistent with the approximate dot products
+            sq_norms = np.einsum("ij,ij->i", codes, codes, dtype=np.float32) * scales ** 2
+        elif self.quantization == "binary":
+            sq_norms = None
+        else:
+            sq_norms = np.einsum("ij,ij->i", embeddings, embeddings)
+
+        # Swap in the new arrays together so concurrent searches see a consistent index
+        self.embeddings, self.sq_norms, self.codes, self.scales, self.docs, self.rows, self.built_at = (
+            embeddings,
+            sq_norms,
+            codes,
+            scales,
+            meta["docs"],
+            {doc["id"]: row for row, doc in enumerate(meta["docs"])},
+            meta["built_at"],
+        )
+        return True
+
+    def _load_codes(self, embeddings: np.ndarray):
+        """Read the quantized codes into memory, computing them if the index predates them."""
+        if self.quantization == "int8":
+            codes_path = os.path.join(self.index_dir, INT8_CODES_FILE)
+            scales_path = os.path.join(self.index_dir, INT8_SCALES_FILE)
+            if os.path.exists(codes_path) and os.path.exists(scales_path):
+                return np.load(codes_path), np.load(scales_path)
+            return quantize_int8(embeddings)
+        if self.quantization == "binary":
+            codes_path = os.path.join(self.index_dir, BINARY_CODES_FILE)
+            if os.path.exists(codes_path):
+                return np.load(codes_path), None
+            return quantize_binary(embeddings), None
+        return None, None
+
+    def search(self, query_vector: List[float], limit: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Return the ``limit`` nearest documents as (doc, euclidean distance) pairs."""
+        embeddings, sq_norms, docs = self.embeddings, self.sq_norms, self.docs
+        if not docs:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        limit = min(limit, len(docs))
+        if self.quantization != "none":
+            return self._search_quantized(query, limit)
+
+        # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2
+        distances = sq_norms - 2.0 * (embeddings @ query) + query @ query
+        top = np.argpartition(distances, limit - 1)[:limit]
+        top = top[np.argsort(distances[top])]
+
+        return [(docs[i], float(np.sqrt(max(distances[i], 0.0)))) for i in top]
+
+    def _search_quantized(self, query: np.ndarray, limit: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Shortlist candidates from the codes, then rank them by exact float distance."""
+        embeddings, sq_norms, codes, scales, docs = (
+            self.embeddings, self.sq_norms, self.codes, self.scales, self.docs
+        )
+        scores = np.empty(len(docs), dtype=np.float32)
+        if self.quantization == "binary":
+            query_bits = quantize_binary(query)
+        for start in range(0, len(docs), SCAN_BLOCK_ROWS):
+            block = codes[start:start + SCAN_BLOCK_ROWS]
+            if self.quantization == "int8":
+                block_scales = scales[start:start + SCAN_BLOCK_ROWS]
+                scores[start:start + len(block)] = (
+                    sq_norms[start:start + len(block)] - 2.0 * block_scales * (block.astype(np.float32) @ query)
+                )
+            else:
+                # Hamming distance between sign bits
+                scores[start:start + len(block)] = POPCOUNT[block ^ query_bits].sum(axis=1, dtype=np.int32)
+
+        shortlist = min(max(RESCORE_CANDIDATES, limit), len(docs))
+        candidates = np.sort(np.argpartition(scores, shortlist - 1)[:shortlist])
+        diffs = embeddings[candidates] - query
+        distances = np.sqrt(np.einsum("ij,ij->i", diffs, diffs))
+        order = np.argsort(distances)[:limit]
+
+        return [(docs[candidates[i]], float(distances[i])) for i in order]
+
+    def _save(self, docs: List[Dict[str, Any]], embeddings: np.ndarray) -> None:
+        """Write the index files atomically so readers never see a half-written index."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        docs_path = os.path.join(self.index_dir, DOCS_FILE)
+
+        arrays = {EMBEDDINGS_FILE: embeddings}
+        if self.quantization == "int8":
+            arrays[INT8_CODES_FILE], arrays[INT8_SCALES_FILE] = quantize_int8(embeddings)
+        elif self.quantization == "binary":
+            arrays[BINARY_CODES_FILE] = quantize_binary(embeddings)
+
+        for name, array in arrays.items():
+            path = os.path.join(self.index_dir, name)
+            np.save(path + ".tmp.npy", array)
+            os.replace(path + ".tmp.npy", path)
+        # Drop codes of another quantization mode, they no longer match the vectors
+        for name in (INT8_CODES_FILE, INT8_SCALES_FILE, BINARY_CODES_FILE):
+            path = os.path.join(self.index_dir, name)
+            if name not in arrays and os.path.exists(path):
+                os.remove(path)
+
+        tmp_docs = docs_path + ".tmp"
+        with open(tmp_docs, "w", encoding="utf-8") as f:
+            json.dump({"built_at": time.time(), "docs": docs}, f)
+        # The docs file goes last, it marks the arrays as complete
+        os.replace(tmp_docs, docs_path)
+
+
+def firestore_records(db, collection_names: List[str]) -> Iterable[Tuple[Dict[str, Any], List[float]]]:
+    """Stream (doc, embedding) pairs from the given Firestore collections."""
+    for collection_name in collection_names:
+        query = db.collection(collection_name).select(["url", "content", "embedding_map"])
+        for snapshot in query.stream():
+            data = snapshot.to_dict()
+            vector = data.get("embedding_map")
+            if vector is None:
+                continue
+            doc = {
+                "id": snapshot.id,
+                "collection": collection_name,
+                "content": data.get("content", ""),
+                "url": data.get("url", ""),
+            }
+            yield doc, list(vector)
+
+
+def firestore_documents(db, collection_names: List[str]) -> Iterable[Tuple[Dict[str, Any], None]]:
+    """Stream (doc, None) pairs with only the url and content, for indexes that don't need embeddings."""
+    for collection_name in collection_names:
+        for snapshot in db.collection(collection_name).select(["url", "content"]).stream():
+            data = snapshot.to_dict()
+            doc = {
+                "id": snapshot.id,
+                "collection": collection_name,
+                "content": data.get("content", ""),
+                "url": data.get("url", ""),
+            }
+            yield doc, None
+
+
+class FirestoreSyncedIndex:
+    """Keeps a LocalVectorIndex (or BM25Index) in sync with Firestore, which stays the source of truth.
+
+    The index is loaded from disk when available and rebuilt from Firestore in a
+    background thread once it is older than ``refresh_interval`` seconds. Searches
+    keep hitting the current index while a rebuild is running.
+
+    If there is no saved index, the first build happens in the constructor and
+    its errors are raised, so a deployment never silently serves an empty index.
+    With ``build_in_background`` it runs in a thread instead and searches return
+    nothing until it is done. Errors of background builds are kept in
+    ``last_error`` and retried after ``retry_interval`` seconds.
+
+    ``records`` streams the (doc, embedding) pairs the index is built from.
+    """
+
+    def __init__(self, db, collection_names: List[str], index=None,
+                 refresh_interval: float = 3600.0, records=firestore_records,
+                 build_in_background: bool = False, retry_interval: float = 60.0):
+        self.db = db
+        self.collection_names = collection_names
+        self.index = index or LocalVectorIndex()
+        self.refresh_interval = refresh_interval
+        self.records = records
+        self.retry_interval = retry_interval
+        self.last_error = None
+        self._refresh_lock = threading.Lock()
+        self._next_refresh = 0.0
+
+        if self.index.load():
+            self._next_refresh = self.index.built_at + refresh_interval
+        elif build_in_background:
+            print(f"No saved {type(self.index).__name__} found, building from Firestore in the background")
+            self._refresh_in_background()
+        else:
+            print(f"No saved {type(self.index).__name__} found, building from Firestore")
+            self.refresh(raise_errors=True)
+
+    def refresh(self, raise_errors: bool = False) -> None:
+        """Rebuild the index from Firestore. Concurrent calls are collapsed into one."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            start = time.time()
+            self.index.build(self.records(self.db, self.collection_names))
+            self.last_error = None
+            self._next_refresh = self.index.built_at + self.refresh_interval
+            print(f"Built {type(self.index).__name__} with {len(self.index)} documents in {time.time() - start:.1f}s")
+        except Exception as e:
+            self.last_error = e
+            self._next_refresh = time.time() + self.retry_interval
+            print(f"Error building {type(self.index).__name__}: {e}")
+            if raise_errors:
+                raise
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_in_background(self) -> None:
+        # Push the next attempt out first, so searches during the build don't start more threads
+        self._next_refresh = time.time() + self.retry_interval
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def search(self, query, limit: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Search the wrapped index with its own query type, a vector or text."""
+        if self.refresh_interval and time.time() >= self._next_refresh:
+            self._refresh_in_background()
+        return self.index.search(query, limit)
+
+
+if __name__ == "__main__":
+    # Build the index ahead of deployment, e.g. as part of the container image
+    import sys
+    from google.cloud import firestore
+
+    collections = sys.argv[1:] or os.getenv("RAG_INDEX_COLLECTIONS", "gchat_messages_v2").split(",")
+    client = firestore.Client(
+        project=os.getenv("GOOGLE_CLOUD_PROJECT", "joon-sandbox"),
+        database=os.getenv("FIRESTORE_DATABASE", "test-db"),
+    )
+    index = LocalVectorIndex()
+    index.build(firestore_records(client, collections))
+    print(f"Built local vector index with {len(index)} documents in {index.index_dir}")
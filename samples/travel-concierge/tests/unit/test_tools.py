@@ -14,17 +14,32 @@
 
 """Basic tests for individual tools."""
 
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
+from unittest import mock
 
 from dotenv import load_dotenv
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.artifacts import InMemoryArtifactService
+from google.adk.events import Event
 from google.adk.sessions import InMemorySessionService
 from google.adk.tools import ToolContext
 import pytest
 from travel_concierge.agent import root_agent
-from travel_concierge.tools.memory import memorize
-from travel_concierge.tools.places import map_tool
+from travel_concierge.shared_libraries.instruction_cache import cache_instruction
+from travel_concierge.sub_agents.in_trip.tools import (
+    compile_timeline,
+    find_segment,
+    monitor_itinerary,
+)
+from travel_concierge.tools import memory
+from travel_concierge.tools.memory import forget_items, memorize, memorize_list_items
+from travel_concierge.tools.places import CircuitBreaker, PlacesService, map_tool
+from travel_concierge.tools.places_cache import PlacesCache
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -68,6 +83,142 @@ class TestAgents(unittest.TestCase):
             self.tool_context.state["itinerary_datetime"], "12/31/2025 11:59:59"
         )
 
+    def test_memory_list(self):
+        self.tool_context.state["likes"] = ["museums"]
+        memorize_list_items(
+            key="likes",
+            values=["beaches", "museums", "hiking"],
+            tool_context=self.tool_context,
+        )
+        forget_items(
+            key="likes", values=["museums", "opera"], tool_context=self.tool_context
+        )
+        self.assertEqual(self.tool_context.state["likes"], ["beaches", "hiking"])
+        self.assertIn("hiking", self.tool_context.state["likes"])
+
+    def test_memory_list_scalars(self):
+        self.tool_context.state["dislikes"] = "crowds"
+        memorize_list_items(
+            key="dislikes", values=["queues"], tool_context=self.tool_context
+        )
+        self.assertEqual(self.tool_context.state["dislikes"], ["crowds", "queues"])
+
+        self.tool_context.state["budget"] = {"max": 100}
+        result = memorize_list_items(
+            key="budget", values=["cheap"], tool_context=self.tool_context
+        )
+        self.assertIn("Cannot", result["status"])
+        self.assertEqual(self.tool_context.state["budget"], {"max": 100})
+
+    def test_memory_list_in_profile(self):
+        self.tool_context.state["user_profile"] = {"likes": ["museums"], "allergies": []}
+        memorize_list_items(
+            key="likes", values=["beaches"], tool_context=self.tool_context
+        )
+        forget_items(key="likes", values=["museums"], tool_context=self.tool_context)
+        self.assertNotIn("likes", self.tool_context.state)
+
+        # The next turn renders {user_profile} from the session the tool's state delta is applied to.
+        session_service.append_event(
+            self.session,
+            Event(
+                invocation_id="ABCD",
+                author="post_trip_agent",
+                actions=self.tool_context.actions,
+            ),
+        )
+        session = session_service.get_session(
+            app_name="Travel_Concierge",
+            user_id=self.user_id,
+            session_id=self.session_id,
+        )
+        self.assertEqual(
+            session.state["user_profile"], {"likes": ["beaches"], "allergies": []}
+        )
+
+    def test_find_segment(self):
+        profile = {"home": {"event_type": "home", "address": "Home", "local_prefer_mode": "drive"}}
+        itinerary = {
+            "days": [
+                {
+                    "date": "2025-06-16",
+                    "events": [
+                        {"event_type": "visit", "description": "Dinner", "start_time": "19:00", "end_time": "21:00"},
+                        {"event_type": "visit", "description": "Museum", "start_time": "09:00", "end_time": "12:00"},
+                    ],
+                },
+                {
+                    "date": "2025-06-17",
+                    "events": [
+                        {"event_type": "visit", "description": "Market", "start_time": "08:00", "end_time": "10:00"},
+                    ],
+                },
+            ]
+        }
+        timeline = compile_timeline(itinerary)
+        self.assertEqual(timeline["events"], [[0, 1], [0, 0], [1, 0]])
+
+        travel_from, travel_to, _, arrive_by = find_segment(
+            profile, itinerary, "2025-06-16 13:00", timeline
+        )
+        self.assertTrue(travel_from.startswith("Museum"))
+        self.assertTrue(travel_to.startswith("Dinner"))
+        self.assertEqual(arrive_by, "19:00")
+
+        _, travel_to, _, _ = find_segment(profile, itinerary, "2025-06-16 22:00", timeline)
+        self.assertTrue(travel_to.startswith("Market"))
+
+    def test_compile_timeline_malformed_dates(self):
+        itinerary = {
+            "days": [
+                {"date": "June 16th", "events": [{"event_type": "visit", "start_time": "09:00"}]},
+                {"events": [{"event_type": "visit", "start_time": "10:00"}]},
+                {"date": "2025-06-17", "events": [{"event_type": "flight"}, {"start_time": "08:00"}]},
+            ]
+        }
+        timeline = compile_timeline(itinerary)
+        self.assertEqual(timeline["events"], [[2, 0], [2, 1]])
+        self.assertTrue(all(key.startswith("2025-06-17") for key in timeline["keys"]))
+
+    def test_instruction_cache(self):
+        renders = []
+
+        @cache_instruction(["itinerary_datetime"])
+        def provider(readonly_context):
+            renders.append(1)
+            return f'Now is {readonly_context.state["itinerary_datetime"]}'
+
+        self.tool_context.state["itinerary_datetime"] = "2025-06-16 10:00"
+        self.assertEqual(provider(self.tool_context), "Now is 2025-06-16 10:00")
+        self.assertEqual(provider(self.tool_context), "Now is 2025-06-16 10:00")
+        self.tool_context.state["itinerary_datetime"] = "2025-06-16 11:00"
+        self.assertEqual(provider(self.tool_context), "Now is 2025-06-16 11:00")
+        self.assertEqual(len(renders), 2)
+
+    def test_monitor_itinerary(self):
+        self.tool_context.state["itinerary"] = {
+            "days": [
+                {
+                    "date": "2025-06-16",
+                    "events": [
+                        {"event_type": "flight", "description": "Flight to Seattle", "flight_number": "AA123"},
+                        {"event_type": "visit", "description": "Space Needle", "booking_required": True},
+                    ],
+                }
+            ]
+        }
+        result = monitor_itinerary(tool_context=self.tool_context)
+        checks = [(c["event"], c["check"]) for c in result["checks"]]
+        self.assertEqual(
+            checks,
+            [
+                ("Flight to Seattle", "flight_status_check"),
+                ("Space Needle", "event_booking_check"),
+                ("Space Needle", "weather_impact_check"),
+            ],
+        )
+        self.assertEqual(result["checks"][1]["status"], "Space Needle is closed.")
+
     def test_places(self):
         self.tool_context.state["poi"] = {
             "places": [{"place_name": "Machu Picchu", "address": "Machu Picchu, Peru"}]
@@ -79,3 +230,85 @@ class TestAgents(unittest.TestCase):
             self.tool_context.state["poi"]["places"][0]["place_id"],
             "ChIJVVVViV-abZERJxqgpA43EDo",
         )
+
+    def test_places_cache(self):
+        calls = []
+
+        def fetch(query):
+            calls.append(query)
+            return {"place_id": "ChIJVVVViV-abZERJxqgpA43EDo"}
+
+        cache = PlacesCache(path=None)
+        cache.get_or_fetch("Machu Picchu, Peru", fetch)
+        result = cache.get_or_fetch("  machu picchu,  PERU ", fetch)
+        self.assertEqual(result["place_id"], "ChIJVVVViV-abZERJxqgpA43EDo")
+        self.assertEqual(len(calls), 1)
+
+    def test_places_cache_persistence(self):
+        candidate = {
+            "place_id": "ChIJVVVViV-abZERJxqgpA43EDo",
+            "name": "Machu Picchu",
+            "formatted_address": "Machu Picchu, Peru",
+            "geometry": {"location": {"lat": -13.16, "lng": -72.54}},
+        }
+        path = os.path.join(tempfile.mkdtemp(), "places.sqlite")
+        cache = PlacesCache(path=path, persist=lambda value: {"place_id": value["place_id"]})
+        self.assertIs(cache.get_or_fetch("Machu Picchu", lambda query: candidate), candidate)
+
+        # Only the persisted fields survive a restart.
+        restarted = PlacesCache(path=path)
+        result = restarted.get_or_fetch("Machu Picchu", lambda query: None)
+        self.assertEqual(result, {"place_id": "ChIJVVVViV-abZERJxqgpA43EDo"})
+
+        # A locked database falls back to fetching.
+        locked = PlacesCache(path=path)
+        locked._db = mock.Mock()
+        locked._db.execute.side_effect = sqlite3.OperationalError("database is locked")
+        result = locked.get_or_fetch("Machu Picchu", lambda query: candidate)
+        self.assertIs(result, candidate)
+
+    def test_places_in_parallel(self):
+        class SlowPlacesService(PlacesService):
+            def find_place_from_text(self, query):
+                if query == "slow":
+                    time.sleep(1)
+                return {"place_id": query}
+
+        service = SlowPlacesService(cache=PlacesCache(path=None))
+        results = service.find_places_from_text(["a", "slow", "b"], timeout=0.5)
+        self.assertEqual(results[0]["place_id"], "a")
+        self.assertIn("error", results[1])
+        self.assertEqual(results[2]["place_id"], "b")
+
+    def test_places_in_parallel_cancels_queued_lookups(self):
+        started = []
+
+        class SlowPlacesService(PlacesService):
+            def find_place_from_text(self, query):
+                started.append(query)
+                time.sleep(0.5)
+                return {"place_id": query}
+
+        service = SlowPlacesService(cache=PlacesCache(path=None))
+        service.executor = ThreadPoolExecutor(max_workers=1)
+        results = service.find_places_from_text(["a", "b", "c"], timeout=0.1)
+        self.assertTrue(all("error" in result for result in results))
+        service.executor.shutdown(wait=True)
+        self.assertEqual(started, ["a"])
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow_request())  # The trial call.
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertTrue(breaker.allow_request())
+
+    def test_scenario_cache(self):
+        path = "travel_concierge/profiles/itinerary_seattle_example.json"
+        first = memory._read_scenario(path)
+        self.assertIs(memory._read_scenario(path), first)
@@ -23,6 +23,7 @@ PROF_KEY = "user_profile"
 ITIN_START_DATE = "itinerary_start_date"
 ITIN_END_DATE = "itinerary_end_date"
 ITIN_DATETIME = "itinerary_datetime"
+ITIN_TIMELINE = "_itin_timeline"
 
 START_DATE = "start_date"
 END_DATE = "end_date"
@@ -0,0 +1,81 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memoization for dynamic instruction providers."""
+
+from collections import OrderedDict
+import functools
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Callable, Sequence
+
+from google.adk.agents.readonly_context import ReadonlyContext
+
+logger = logging.getLogger(__name__)
+
+InstructionProvider = Callable[[ReadonlyContext], str]
+
+
+def state_digest(value: Any) -> str:
+    """Returns a digest of a JSON-like state value, independent of key order."""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def cache_instruction(
+    state_keys: Sequence[str], max_entries: int = 256
+) -> Callable[[InstructionProvider], InstructionProvider]:
+    """
+    Caches the instruction rendered by a provider until the state it reads changes.
+
+    The provider must only depend on the given state keys, which are digested
+    to form the cache key. Rendered instructions are kept in an LRU shared by
+    all sessions, so identical itineraries share one entry.
+
+    Args:
+        state_keys: The session state keys the provider reads.
+        max_entries: The number of rendered instructions to keep.
+
+    Returns:
+        A decorator for instruction providers.
+    """
+
+    def decorator(provider: InstructionProvider) -> InstructionProvider:
+        rendered: OrderedDict[tuple, str] = OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(provider)
+        def wrapper(readonly_context: ReadonlyContext) -> str:
+            state = readonly_context.state
+            key = tuple(state_digest(state.get(k)) for k in state_keys)
+            with lock:
+                instruction = rendered.get(key)
+                if instruction is not None:
+                    rendered.move_to_end(key)
+                    logger.debug("Reusing the %s instruction", provider.__name__)
+                    return instruction
+
+            instruction = provider(readonly_context)
+            with lock:
+                rendered[key] = instruction
+                while len(rendered) > max_entries:
+                    rendered.popitem(last=False)
+            return instruction
+
+        wrapper.cache_clear = rendered.clear
+        return wrapper
+
+    return decorator
@@ -14,7 +14,7 @@
 
 """Common data schema and types for travel-concierge agents."""
 
-from typing import Optional, Union
+from typing import Hashable, Iterable, Optional, Union
 
 from google.genai import types
 from pydantic import BaseModel, Field
@@ -26,6 +26,57 @@ json_response_config = types.GenerateContentConfig(
 )
 
 
+class OrderedSet(list):
+    """An insertion-ordered list of unique values with O(1) membership tests.
+
+    It is a list, so it serializes into ADK session state, JSON and prompts
+    exactly like the plain lists stored before. Use add/update/discard/
+    difference_update to modify it so that the membership index stays in sync.
+    """
+
+    def __init__(self, items: Iterable[Hashable] = ()):
+        super().__init__()
+        self.update(items)
+
+    @property
+    def _members(self) -> dict:
+        # Built lazily, so copies and unpickled instances rebuild it on first use.
+        members = self.__dict__.get("_index")
+        if members is None or len(members) != len(self):
+            members = self.__dict__["_index"] = dict.fromkeys(self)
+        return members
+
+    def __contains__(self, value) -> bool:
+        return value in self._members
+
+    def add(self, value: Hashable) -> bool:
+        """Appends a value if absent; returns whether it was added."""
+        members = self._members
+        if value in members:
+            return False
+        members[value] = None
+        self.append(value)
+        return True
+
+    def update(self, values: Iterable[Hashable]) -> list:
+        """Appends all absent values; returns the ones added."""
+        return [value for value in values if self.add(value)]
+
+    def discard(self, value: Hashable) -> bool:
+        """Removes a value if present; returns whether it was removed."""
+        return bool(self.difference_update([value]))
+
+    def difference_update(self, values: Iterable[Hashable]) -> list:
+        """Removes all the given values in a single pass; returns the ones removed."""
+        members = self._members
+        removed = [value for value in dict.fromkeys(values) if value in members]
+        if removed:
+            for value in removed:
+                del members[value]
+            self[:] = [value for value in self if value in members]
+        return removed
+
+
 class Room(BaseModel):
     """A room for selection."""
     is_available: bool = Field(
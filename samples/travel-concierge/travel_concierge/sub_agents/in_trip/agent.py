@@ -19,9 +19,11 @@ from google.adk.tools.agent_tool import AgentTool
 
 from travel_concierge.sub_agents.in_trip import prompt
 from travel_concierge.sub_agents.in_trip.tools import (
+    _compile_itinerary_timeline,
     transit_coordination,
     flight_status_check,
     event_booking_check,
+    monitor_itinerary,
     weather_impact_check,
 )
 
@@ -34,6 +36,7 @@ day_of_agent = Agent(
     name="day_of_agent",
     description="Day_of agent is the agent handling the travel logistics of a trip.",
     instruction=transit_coordination,
+    before_agent_callback=_compile_itinerary_timeline,
 )
 
 
@@ -42,7 +45,12 @@ trip_monitor_agent = Agent(
     name="trip_monitor_agent",
     description="Monitor aspects of a itinerary and bring attention to items that necessitate changes",
     instruction=prompt.TRIP_MONITOR_INSTR,
-    tools=[flight_status_check, event_booking_check, weather_impact_check],
+    tools=[
+        monitor_itinerary,
+        flight_status_check,
+        event_booking_check,
+        weather_impact_check,
+    ],
     output_key="daily_checks",  # can be sent via email.
 )
 
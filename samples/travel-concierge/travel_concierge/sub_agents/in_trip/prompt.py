@@ -33,10 +33,12 @@ Identify these type of events, and note their details:
 - Events that requires booking: note the event name, date and location.
 - Activities or visits that may be impacted by weather: note date, location and desired weather.
 
-For each identified events, checks their status using tools:s
+Call `monitor_itinerary` once to check all of them together, it returns the status of every check performed.
+
+Only when a check did not complete in time, check that event on its own using tools:
 - flights delays or cancelations - use `flight_status_check`
 - events that requires booking - use `event_booking_check`
-- outdoor activities that may be affected by weather, weather forecasts - use `weather_impact`
+- outdoor activities that may be affected by weather, weather forecasts - use `weather_impact_check`
 
 Summarize and present a short list of suggested changes if any for the user's attention. For example:
 - Flight XX123 is cancelled, suggest rebooking.
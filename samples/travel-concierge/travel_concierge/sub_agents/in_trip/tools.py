@@ -14,24 +14,44 @@
 
 """Tools for the in_trip, trip_monitor and day_of agents."""
 
-from datetime import datetime
-from typing import Dict, Any
-
+import bisect
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, time
+import logging
+import os
+from typing import Dict, Any, List, Optional
+
+from google.adk.agents.callback_context import CallbackContext
 from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools import ToolContext
 
 from travel_concierge.sub_agents.in_trip import prompt
 from travel_concierge.shared_libraries import constants
+from travel_concierge.shared_libraries.instruction_cache import (
+    cache_instruction,
+    state_digest,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_CHECK_WORKERS = int(os.getenv("TRIP_MONITOR_MAX_WORKERS", "8"))
+# Overall time budget for all the status checks of one monitor_itinerary call.
+MONITOR_DEADLINE_SECONDS = float(os.getenv("TRIP_MONITOR_DEADLINE_SECONDS", "10"))
+
+_check_executor = ThreadPoolExecutor(
+    max_workers=MAX_CHECK_WORKERS, thread_name_prefix="trip_monitor"
+)
 
 
 def flight_status_check(flight_number: str, flight_date: str, checkin_time: str, departure_time: str):
     """Checks the status of a flight, given its flight_number, date, checkin_time and departure_time."""
-    print("Checking", flight_number, flight_date, checkin_time, departure_time)
+    logger.debug("Checking %s %s %s %s", flight_number, flight_date, checkin_time, departure_time)
     return {"status": f"Flight {flight_number} checked"}
 
 
 def event_booking_check(event_name: str, event_date: str, event_location: str):
     """Checks the status of an event that requires booking, given its event_name, date, and event_location."""
-    print("Checking", event_name, event_date, event_location)
+    logger.debug("Checking %s %s %s", event_name, event_date, event_location)
     if event_name.startswith("Space Needle"):  # Mocking an exception to illustrate
         return {"status": f"{event_name} is closed."}
     return {"status": f"{event_name} checked"}
@@ -49,10 +69,80 @@ def weather_impact_check(activity_name: str, activity_date: str, activity_locati
     Returns:
         A dictionary containing the status of the activity.
     """
-    print("Checking", activity_name, activity_date, activity_location)
+    logger.debug("Checking %s %s %s", activity_name, activity_date, activity_location)
     return {"status": f"{activity_name} checked"}
 
 
+def _itinerary_checks(itinerary: Dict[str, Any]) -> List[tuple]:
+    """Returns the (event description, date, check function, kwargs) applicable to each event."""
+    checks = []
+    for day in itinerary.get("days", []):
+        event_date = day["date"]
+        for event in day["events"]:
+            description = event.get("description", event["event_type"])
+            location = event.get("location") or event.get("address", "")
+            if event["event_type"] == "flight":
+                checks.append((description, event_date, flight_status_check, {
+                    "flight_number": event.get("flight_number", ""),
+                    "flight_date": event_date,
+                    "checkin_time": event.get("boarding_time", ""),
+                    "departure_time": event.get("departure_time", ""),
+                }))
+                continue
+            if event.get("booking_required"):
+                checks.append((description, event_date, event_booking_check, {
+                    "event_name": description,
+                    "event_date": event_date,
+                    "event_location": location,
+                }))
+            if event["event_type"] == "visit":
+                checks.append((description, event_date, weather_impact_check, {
+                    "activity_name": description,
+                    "activity_date": event_date,
+                    "activity_location": location,
+                }))
+    return checks
+
+
+def monitor_itinerary(tool_context: ToolContext):
+    """
+    Runs every applicable status check on the itinerary at once: flight status for
+    flights, booking status for events that require booking, and weather impact for visits.
+    Checks that have not completed within MONITOR_DEADLINE_SECONDS of the call are
+    reported as incomplete.
+
+    Args:
+        tool_context: The ADK tool context.
+
+    Returns:
+        A list with the event, the check performed and its status, for every check.
+    """
+    itinerary = tool_context.state.get(constants.ITIN_KEY)
+    if not itinerary:
+        return {"status": "There is no itinerary to monitor."}
+
+    checks = _itinerary_checks(itinerary)
+    futures = [_check_executor.submit(check, **kwargs) for _, _, check, kwargs in checks]
+    wait(futures, timeout=MONITOR_DEADLINE_SECONDS)
+
+    results = []
+    for (description, event_date, check, _), future in zip(checks, futures):
+        if not future.done():
+            future.cancel()
+            status = f"{check.__name__} did not complete in time, check it individually."
+        elif future.exception() is not None:
+            status = f"{check.__name__} failed: {future.exception()}"
+        else:
+            status = future.result()["status"]
+        results.append({
+            "event": description,
+            "date": event_date,
+            "check": check.__name__,
+            "status": status,
+        })
+    return {"checks": results}
+
+
 def get_event_time_as_destination(destin_json: Dict[str, Any], default_value: str):
     """Returns an event time appropriate for the location type."""
     match destin_json["event_type"]:
@@ -124,7 +214,96 @@ def parse_as_destin(destin_json: Dict[str, Any]):
             return "Local in the region", "as soon as possible"
 
 
-def find_segment(profile: Dict[str, Any], itinerary: Dict[str, Any], current_datetime: str):
+def _parse_event_time(value: Optional[str]) -> time:
+    """Parses an event time such as '07:30' or '7:30 PM'; unknown times sort to the end of the day."""
+    if value:
+        value = value.strip()
+        try:
+            return time.fromisoformat(value)
+        except ValueError:
+            pass
+        for time_format in ("%I:%M %p", "%I:%M%p", "%I %p"):
+            try:
+                return datetime.strptime(value.upper(), time_format).time()
+            except ValueError:
+                continue
+    return time.max.replace(microsecond=0)
+
+
+def itinerary_version(itinerary: Dict[str, Any]) -> str:
+    """Returns a digest identifying this revision of the itinerary."""
+    return state_digest(itinerary)
+
+
+def compile_timeline(itinerary: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens the itinerary into a chronologically sorted timeline of events.
+
+    The timeline only holds strings and integers so it can be kept in the session state.
+    Days without a valid ISO date are left out and logged, so a hand-edited
+    itinerary cannot break the in-trip agents.
+
+    Args:
+        itinerary: A dictionary following the schema in types.Itinerary.
+
+    Returns:
+      version - the itinerary_version the timeline was compiled from.
+      keys    - the ISO datetime of each event, sorted.
+      events  - the [day index, event index] of each event, in the same order.
+    """
+    entries = []
+    for day_index, day in enumerate(itinerary.get("days", [])):
+        try:
+            event_date = date.fromisoformat(day["date"])
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Skipping itinerary day %d without a valid date: %r", day_index, day.get("date"))
+            continue
+        for event_index, event in enumerate(day.get("events", [])):
+            try:
+                event_time = _parse_event_time(get_event_time_as_destination(event, None))
+            except KeyError:
+                event_time = _parse_event_time(None)
+            key = datetime.combine(event_date, event_time).isoformat(timespec="seconds")
+            entries.append((key, day_index, event_index))
+    entries.sort()  # Stable on (day, event) for events at the same time.
+    return {
+        "version": itinerary_version(itinerary),
+        "keys": [key for key, _, _ in entries],
+        "events": [[day_index, event_index] for _, day_index, event_index in entries],
+    }
+
+
+def _get_timeline(state, itinerary: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the timeline cached in the state, compiling it if the itinerary changed."""
+    timeline = state.get(constants.ITIN_TIMELINE)
+    if timeline and timeline["version"] == itinerary_version(itinerary):
+        return timeline
+    return compile_timeline(itinerary)
+
+
+def _compile_itinerary_timeline(callback_context: CallbackContext):
+    """
+    Caches the compiled itinerary timeline in the session state.
+    Set this as the before_agent_callback of agents using transit_coordination,
+    whose readonly context cannot write to the state.
+
+    Args:
+        callback_context: The callback context.
+    """
+    itinerary = callback_context.state.get(constants.ITIN_KEY)
+    if not itinerary:
+        return
+    timeline = callback_context.state.get(constants.ITIN_TIMELINE)
+    if not timeline or timeline["version"] != itinerary_version(itinerary):
+        callback_context.state[constants.ITIN_TIMELINE] = compile_timeline(itinerary)
+
+
+def find_segment(
+    profile: Dict[str, Any],
+    itinerary: Dict[str, Any],
+    current_datetime: str,
+    timeline: Optional[Dict[str, Any]] = None,
+):
     """
     Find the events to travel from A to B
     This follows the itinerary schema in types.Itinerary.
@@ -135,7 +314,8 @@ def find_segment(profile: Dict[str, Any], itinerary: Dict[str, Any], current_dat
     Args:
         profile: A dictionary containing the user's profile.
         itinerary: A dictionary containing the user's itinerary.
-        current_datetime: A string containing the current date and time.   
+        current_datetime: A string containing the current date and time.
+        timeline: The compile_timeline of the itinerary, compiled here if omitted.
 
     Returns:
       from - capture information about the origin of this segment.
@@ -143,41 +323,24 @@ def find_segment(profile: Dict[str, Any], itinerary: Dict[str, Any], current_dat
       arrive_by - an indication of the time we shall arrive at the destination.
     """
     # Expects current_datetime is in '2024-03-15 04:00:00' format
-    datetime_object = datetime.fromisoformat(current_datetime)
-    current_date = datetime_object.strftime("%Y-%m-%d")
-    current_time = datetime_object.strftime("%H:%M")
-    event_date = current_date
-    event_time = current_time
+    now = datetime.fromisoformat(current_datetime).isoformat(timespec="seconds")
 
-    print("-----")
-    print("MATCH DATE", current_date, current_time)
-    print("-----")
+    logger.debug("Matching itinerary events at %s", now)
 
-    # defaults
-    origin_json = profile["home"]
-    destin_json = profile["home"]
+    if timeline is None:
+        timeline = compile_timeline(itinerary)
+    keys = timeline["keys"]
 
-    leave_by = "No movement required"
-    arrive_by = "No movement required"
+    def event_at(position: int) -> Dict[str, Any]:
+        if position < 0:
+            return profile["home"]
+        day_index, event_index = timeline["events"][position]
+        return itinerary["days"][day_index]["events"][event_index]
 
-    # Go through the itinerary to find where we are base on the current date and time
-    for day in itinerary.get("days", []):
-        event_date = day["date"]
-        for event in day["events"]:
-            # for every event we update the origin and destination until
-            # we find one we need to pay attention
-            origin_json = destin_json
-            destin_json = event
-            event_time = get_event_time_as_destination(destin_json, current_time)
-            # The moment we find an event that's in the immediate future we stop to handle it
-            print(
-                event["event_type"], event_date, current_date, event_time, current_time
-            )
-            if event_date >= current_date and event_time >= current_time:
-                break
-        else:  # if inner loop not break, continue
-            continue
-        break  # else break too.
+    # The next event at or after now; past the end of the trip, stay on the last one.
+    position = min(bisect.bisect_left(keys, now), len(keys) - 1)
+    origin_json = event_at(position - 1)
+    destin_json = event_at(position)
 
     #
     # Construct prompt descriptions for travel_from, travel_to, arrive_by
@@ -193,7 +356,7 @@ def _inspect_itinerary(state: dict[str: Any]):
 
     itinerary = state[constants.ITIN_KEY]
     profile = state[constants.PROF_KEY]
-    print("itinerary", itinerary)
+    logger.debug("Itinerary: %s", itinerary)
     current_datetime = itinerary["start_date"] + " 00:00"
     if state.get(constants.ITIN_DATETIME, ""):
         current_datetime = state[constants.ITIN_DATETIME]
@@ -201,6 +364,7 @@ def _inspect_itinerary(state: dict[str: Any]):
     return itinerary, profile, current_datetime
 
 
+@cache_instruction([constants.ITIN_KEY, constants.PROF_KEY, constants.ITIN_DATETIME])
 def transit_coordination(readonly_context: ReadonlyContext):
     """Dynamically generates an instruction for the day_of agent."""
 
@@ -212,18 +376,18 @@ def transit_coordination(readonly_context: ReadonlyContext):
 
     itinerary, profile, current_datetime = _inspect_itinerary(state)
     travel_from, travel_to, leave_by, arrive_by = find_segment(
-        profile, itinerary, current_datetime
+        profile, itinerary, current_datetime, _get_timeline(state, itinerary)
     )
 
-    print("-----")
-    print(itinerary["trip_name"])
-    print(current_datetime)
-    print("-----")
-    print("-----")
-    print("TRIP EVENT")
-    print("FROM", travel_from, leave_by)
-    print("TO", travel_to, arrive_by)
-    print("-----")
+    logger.debug(
+        "Trip %s at %s: from %s (leave by %s) to %s (arrive by %s)",
+        itinerary["trip_name"],
+        current_datetime,
+        travel_from,
+        leave_by,
+        travel_to,
+        arrive_by,
+    )
 
     return prompt.LOGISTIC_INSTR_TEMPLATE.format(
         CURRENT_TIME=current_datetime,
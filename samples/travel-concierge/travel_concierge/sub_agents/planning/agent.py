@@ -14,7 +14,7 @@
 
 """Planning agent. A pre-booking agent covering the planning part of the trip."""
 
-from google.adk.agents import Agent
+from google.adk.agents import Agent, ParallelAgent
 from google.adk.tools.agent_tool import AgentTool
 from google.genai.types import GenerateContentConfig
 from travel_concierge.shared_libraries import types
@@ -85,12 +85,22 @@ flight_search_agent = Agent(
 )
 
 
+# Flight and hotel searches only need the origin, destination and dates, so they run side by side.
+# Their results are kept in the "flight" and "hotel" states for the user's selections.
+flight_and_hotel_search_agent = ParallelAgent(
+    name="flight_and_hotel_search_agent",
+    description="Search flights and hotels at the same time, once origin, destination and dates are known",
+    sub_agents=[flight_search_agent, hotel_search_agent],
+)
+
+
 planning_agent = Agent(
     model="gemini-2.0-flash-001",
     description="""Helps users with travel planning, complete a full itinerary for their vacation, finding best deals for flights and hotels.""",
     name="planning_agent",
     instruction=prompt.PLANNING_AGENT_INSTR,
     tools=[
+        AgentTool(agent=flight_and_hotel_search_agent),
         AgentTool(agent=flight_search_agent),
         AgentTool(agent=flight_seat_selection_agent),
         AgentTool(agent=hotel_search_agent),
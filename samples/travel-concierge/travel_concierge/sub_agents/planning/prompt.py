@@ -27,6 +27,7 @@ You support a number of user journeys:
 - Autonomously help the user find flights and hotels.
 
 You have access to the following tools only:
+- Use the `flight_and_hotel_search_agent` tool to find flight and hotel choices together,
 - Use the `flight_search_agent` tool to find flight choices,
 - Use the `flight_seat_selection_agent` tool to find seat choices,
 - Use the `hotel_search_agent` tool to find hotel choices,
@@ -73,8 +74,12 @@ Make sure you use the information that's already been filled above previously.
   - `end_date`
   To make sure everything is stored correctly, instead of calling memorize all at once, chain the calls such that 
   you only call another `memorize` after the last call has responded. 
-- Use instructions from <FIND_FLIGHTS/> to complete the flight and seat choices.
-- Use instructions from <FIND_HOTELS/> to complete the hotel and room choices.
+- Once origin, destination, start_date and end_date are all known, call `flight_and_hotel_search_agent` once to search flights and hotels at the same time.
+  Its results are kept below, use them instead of calling `flight_search_agent` and `hotel_search_agent` again:
+  <flight>{flight}</flight>
+  <hotel>{hotel}</hotel>
+- Use instructions from <FIND_FLIGHTS/> to complete the flight and seat choices, starting from the flight choices above.
+- Use instructions from <FIND_HOTELS/> to complete the hotel and room choices, starting from the hotel choices above.
 - Finally, use instructions from <CREATE_ITINERARY/> to generate an itinerary.
 </FULL_ITINERARY>
 
@@ -17,12 +17,12 @@
 from google.adk.agents import Agent
 
 from travel_concierge.sub_agents.post_trip import prompt
-from travel_concierge.tools.memory import memorize
+from travel_concierge.tools.memory import forget_items, memorize, memorize_list_items
 
 post_trip_agent = Agent(
     model="gemini-2.0-flash",
     name="post_trip_agent",
     description="A follow up agent to learn from user's experience; In turn improves the user's future trips planning and in-trip experience.",
     instruction=prompt.POSTTRIP_INSTR,
-    tools=[memorize],
+    tools=[memorize, memorize_list_items, forget_items],
 )
@@ -39,6 +39,8 @@ From user's answers, extract the following types of information and use it in th
 - Business reviews and recommendations
 
 For every individually identified preferences, store their values using the `memorize` tool.
+Store the things the user liked, disliked or is allergic to in one call per list, using the `memorize_list_items` tool with the key `likes`, `dislikes` or `allergies`. These update the lists in the user profile.
+If the user no longer holds one of those preferences, remove it using the `forget_items` tool with the same key.
 
 Finally, thank the user, and express that these feedback will be incorporated into their preferences for next time!
 """
@@ -14,21 +14,73 @@
 
 """The 'memorize' tool for several agents to affect session states."""
 
+import copy
 from datetime import datetime
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.sessions.state import State
 from google.adk.tools import ToolContext
 
 from travel_concierge.shared_libraries import constants
+from travel_concierge.shared_libraries.types import OrderedSet
 
 SAMPLE_SCENARIO_PATH = os.getenv(
     "TRAVEL_CONCIERGE_SCENARIO", "travel_concierge/profiles/itinerary_empty_default.json"
 )
 
+# Parsed scenario files by path, with the mtime they were read at.
+_scenario_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+
+def _profile_has(key: str, tool_context: ToolContext) -> bool:
+    profile = tool_context.state.get(constants.PROF_KEY)
+    return isinstance(profile, dict) and key in profile
+
+
+def _state_set(key: str, tool_context: ToolContext) -> OrderedSet:
+    """
+    Returns the list stored under key as an OrderedSet.
+
+    Keys of the user profile, such as likes or allergies, are read from the
+    profile, other keys from the top level of the state. The state holds an
+    OrderedSet only while it stays in memory. Lists loaded from a scenario file,
+    or returned by a session service that serializes the state, are plain lists
+    and are converted on every call. A single string is kept as one item.
+
+    Raises:
+        ValueError: If the key holds something other than a list or a string.
+    """
+    if _profile_has(key, tool_context):
+        items = tool_context.state[constants.PROF_KEY][key]
+    else:
+        items = tool_context.state.get(key)
+    if isinstance(items, OrderedSet):
+        return items
+    if items is None:
+        return OrderedSet()
+    if isinstance(items, str):
+        return OrderedSet([items])
+    if isinstance(items, list):
+        return OrderedSet(items)
+    raise ValueError(f'"{key}" holds a {type(items).__name__}, not a list.')
+
+
+def _store_set(key: str, items: OrderedSet, tool_context: ToolContext):
+    """
+    Writes a list read by _state_set back to where it came from.
+
+    The key, or the whole profile for profile keys, is reassigned even when the
+    list was updated in place, so the change is recorded in the state delta.
+    """
+    if _profile_has(key, tool_context):
+        profile = tool_context.state[constants.PROF_KEY]
+        tool_context.state[constants.PROF_KEY] = {**profile, key: items}
+    else:
+        tool_context.state[key] = items
+
 
 def memorize_list(key: str, value: str, tool_context: ToolContext):
     """
@@ -42,12 +94,31 @@ def memorize_list(key: str, value: str, tool_context: ToolContext):
     Returns:
         A status message.
     """
-    mem_dict = tool_context.state
-    if key not in mem_dict:
-        mem_dict[key] = []
-    if value not in mem_dict[key]:
-        mem_dict[key].append(value)
-    return {"status": f'Stored "{key}": "{value}"'}
+    return memorize_list_items(key, [value], tool_context)
+
+
+def memorize_list_items(key: str, values: List[str], tool_context: ToolContext):
+    """
+    Memorize several pieces of information under the same label at once.
+    Labels of lists in the user profile, e.g. likes, dislikes or allergies,
+    update the user profile.
+
+    Args:
+        key: the label indexing the memory to store the values.
+        values: the pieces of information to be stored.
+        tool_context: The ADK tool context.
+
+    Returns:
+        A status message.
+    """
+    try:
+        items = _state_set(key, tool_context)
+    except ValueError as e:
+        return {"status": f"Cannot store a list: {e}"}
+    items.update(values)
+    _store_set(key, items, tool_context)
+    stored = ", ".join(f'"{value}"' for value in values)
+    return {"status": f'Stored "{key}": {stored}'}
 
 
 def memorize(key: str, value: str, tool_context: ToolContext):
@@ -79,11 +150,31 @@ def forget(key: str, value: str, tool_context: ToolContext):
     Returns:
         A status message.
     """
-    if tool_context.state[key] is None:
-        tool_context.state[key] = []
-    if value in tool_context.state[key]:
-        tool_context.state[key].remove(value)
-    return {"status": f'Removed "{key}": "{value}"'}
+    return forget_items(key, [value], tool_context)
+
+
+def forget_items(key: str, values: List[str], tool_context: ToolContext):
+    """
+    Forget several pieces of information under the same label at once.
+    Labels of lists in the user profile, e.g. likes, dislikes or allergies,
+    update the user profile.
+
+    Args:
+        key: the label indexing the memory to remove the values from.
+        values: the pieces of information to be removed.
+        tool_context: The ADK tool context.
+
+    Returns:
+        A status message.
+    """
+    try:
+        items = _state_set(key, tool_context)
+    except ValueError as e:
+        return {"status": f"Cannot remove from a list: {e}"}
+    items.difference_update(values)
+    _store_set(key, items, tool_context)
+    removed = ", ".join(f'"{value}"' for value in values)
+    return {"status": f'Removed "{key}": {removed}'}
 
 
 def _set_initial_states(source: Dict[str, Any], target: State | dict[str, Any]):
@@ -109,6 +200,28 @@ def _set_initial_states(source: Dict[str, Any], target: State | dict[str, Any]):
             target[constants.ITIN_DATETIME] = itinerary[constants.START_DATE]
 
 
+def _read_scenario(path: str) -> Dict[str, Any]:
+    """
+    Reads a scenario file, reusing the parsed content until the file changes.
+
+    Args:
+        path: Path to the scenario JSON file.
+
+    Returns:
+        The parsed scenario, shared between callers; do not modify it.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _scenario_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with open(path, "r") as file:
+        data = json.load(file)
+        print(f"\nLoading Initial State from {path}\n")
+    _scenario_cache[path] = (mtime, data)
+    return data
+
+
 def _load_precreated_itinerary(callback_context: CallbackContext):
     """
     Sets up the initial state.
@@ -117,10 +230,10 @@ def _load_precreated_itinerary(callback_context: CallbackContext):
 
     Args:
         callback_context: The callback context.
-    """    
-    data = {}
-    with open(SAMPLE_SCENARIO_PATH, "r") as file:
-        data = json.load(file)
-        print(f"\nLoading Initial State: {data}\n")
+    """
+    if constants.ITIN_INITIALIZED in callback_context.state:
+        return  # Already initialized for this session, nothing to load.
 
-    _set_initial_states(data["state"], callback_context.state)
+    data = _read_scenario(SAMPLE_SCENARIO_PATH)
+    # Tools modify the state in place, so each session gets its own copy.
+    _set_initial_states(copy.deepcopy(data["state"]), callback_context.state)
@@ -14,16 +14,107 @@
 
 """Wrapper to Google Maps Places API."""
 
+from concurrent.futures import ThreadPoolExecutor, wait
 import os
-from typing import Dict, List, Any
+import threading
+import time
+from typing import Dict, List, Any, Optional
 
 from google.adk.tools import ToolContext
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from travel_concierge.tools.places_cache import PlacesCache
+
+# Lookups for the POIs of one map_tool call run in parallel on this pool.
+MAX_LOOKUP_WORKERS = int(os.getenv("PLACES_MAX_LOOKUP_WORKERS", "8"))
+# Overall time budget for resolving all the POIs of one map_tool call.
+MAP_TOOL_DEADLINE_SECONDS = float(os.getenv("MAP_TOOL_DEADLINE_SECONDS", "10"))
+# (connect, read) timeouts for a single Places request.
+PLACES_TIMEOUT = (3.05, 5.0)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the Places API while it is deemed unhealthy."""
+
+
+class CircuitBreaker:
+    """Stops calling an API after repeated failures, then lets a trial call through.
+
+    After failure_threshold consecutive failures the circuit opens and calls are
+    rejected for reset_timeout seconds. The next call after that is a trial:
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let this call through and hold off the others.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def _create_session() -> requests.Session:
+    """A keep-alive session that retries 429/5xx responses with jittered backoff."""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        backoff_jitter=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1,  # Only the Places host is called.
+        pool_maxsize=MAX_LOOKUP_WORKERS,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    return session
+
+
+def _persisted_fields(candidate: Dict[str, Any]) -> Dict[str, Any]:
+    """The Places API policies only allow storing the place ID and, for 30 days, lat/lng."""
+    return {
+        "place_id": candidate["place_id"],
+        "geometry": {"location": candidate["geometry"]["location"]},
+    }
 
 
 class PlacesService:
     """Wrapper to Placees API."""
 
+    def __init__(self, cache: Optional[PlacesCache] = None):
+        self.cache = cache if cache is not None else PlacesCache(persist=_persisted_fields)
+        self.session = _create_session()
+        self.circuit_breaker = CircuitBreaker()
+        self.executor = ThreadPoolExecutor(
+            max_workers=MAX_LOOKUP_WORKERS, thread_name_prefix="places"
+        )
+
     def _check_key(self):
         if (
             not hasattr(self, "places_api_key") or not self.places_api_key
@@ -31,9 +122,8 @@ class PlacesService:
             # https://developers.google.com/maps/documentation/places/web-service/get-api-key
             self.places_api_key = os.getenv("GOOGLE_PLACES_API_KEY")
 
-    def find_place_from_text(self, query: str) -> Dict[str, str]:
-        """Fetches place details using a text query."""
-        self._check_key()
+    def _find_candidate(self, query: str) -> Optional[Dict[str, Any]]:
+        """Calls Find Place and returns the first candidate, or None if there is none."""
         places_url = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
         params = {
             "input": query,
@@ -41,39 +131,90 @@ class PlacesService:
             "fields": "place_id,formatted_address,name,photos,geometry",
             "key": self.places_api_key,
         }
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("Places API is temporarily unavailable.")
 
         try:
-            response = requests.get(places_url, params=params)
+            response = self.session.get(places_url, params=params, timeout=PLACES_TIMEOUT)
             response.raise_for_status()
             place_data = response.json()
+            if place_data.get("status") in ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR"):
+                raise requests.exceptions.RequestException(place_data["status"])
+        except requests.exceptions.RequestException:
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+
+        if not place_data.get("candidates"):
+            return None
+        return place_data["candidates"][0]
+
+    def find_place_from_text(self, query: str) -> Dict[str, str]:
+        """
+        Fetches place details using a text query.
+
+        Only the place ID and location are cached across restarts, so results
+        served from the persistent cache have no place_name, place_address or
+        photos.
+        """
+        self._check_key()
 
-            if not place_data.get("candidates"):
+        try:
+            # The raw candidate is cached rather than the result, so the API key
+            # embedded in photo URLs never lands in the cache.
+            place_details = self.cache.get_or_fetch(query, self._find_candidate)
+
+            if not place_details:
                 return {"error": "No places found."}
 
             # Extract data for the first candidate
-            place_details = place_data["candidates"][0]
             place_id = place_details["place_id"]
-            place_name = place_details["name"]
-            place_address = place_details["formatted_address"]
-            photos = self.get_photo_urls(place_details.get("photos", []), maxwidth=400)
-            map_url = self.get_map_url(place_id)
             location = place_details["geometry"]["location"]
-            lat = str(location["lat"])
-            lng = str(location["lng"])
-
-            return {
+            result = {
                 "place_id": place_id,
-                "place_name": place_name,
-                "place_address": place_address,
-                "photos": photos,
-                "map_url": map_url,
-                "lat": lat,
-                "lng": lng,
+                "map_url": self.get_map_url(place_id),
+                "lat": str(location["lat"]),
+                "lng": str(location["lng"]),
             }
+            if "name" in place_details:
+                result["place_name"] = place_details["name"]
+                result["place_address"] = place_details["formatted_address"]
+                result["photos"] = self.get_photo_urls(
+                    place_details.get("photos", []), maxwidth=400
+                )
+            return result
 
         except requests.exceptions.RequestException as e:
             return {"error": f"Error fetching place data: {e}"}
 
+    def find_places_from_text(
+        self, queries: List[str], timeout: Optional[float] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Fetches place details for several text queries concurrently.
+
+        Args:
+            queries: The text queries to resolve.
+            timeout: Seconds to wait for all of them; None waits indefinitely.
+
+        Returns:
+            One result per query, in the same order. Queries that did not
+            finish in time get an error result.
+        """
+        self._check_key()
+        futures = [self.executor.submit(self.find_place_from_text, q) for q in queries]
+        _, not_done = wait(futures, timeout=timeout)
+        # Lookups that have not started are dropped so they don't hold up the
+        # shared pool; running ones finish and still warm the cache.
+        for f in not_done:
+            f.cancel()
+        return [
+            f.result()
+            if f.done() and not f.cancelled()
+            else {"error": "Timed out fetching place data."}
+            for f in futures
+        ]
+
     def get_photo_urls(self, photos: List[Dict[str, Any]], maxwidth: int = 400) -> List[str]:
         """Extracts photo URLs from the 'photos' list."""
         photo_urls = []
@@ -94,7 +235,9 @@ places_service = PlacesService()
 def map_tool(key: str, tool_context: ToolContext):
     """
     This is going to inspect the pois stored under the specified key in the state.
-    One by one it will retrieve the accurate Lat/Lon from the Map API, if the Map API is available for use.
+    It will retrieve the accurate Lat/Lon of all of them in parallel from the Map API, if the Map API is available for use.
+    POIs that cannot be resolved within the deadline, or while the Map API is
+    unhealthy, keep empty placeholders and are marked as not verified.
 
     Args:
         key: The key under which the POIs are stored.
@@ -111,12 +254,15 @@ def map_tool(key: str, tool_context: ToolContext):
         tool_context.state[key]["places"] = []
 
     pois = tool_context.state[key]["places"]
-    for poi in pois:  # The pydantic object types.POI
-        location = poi["place_name"] + ", " + poi["address"]
-        result = places_service.find_place_from_text(location)
+    locations = [poi["place_name"] + ", " + poi["address"] for poi in pois]
+    results = places_service.find_places_from_text(
+        locations, timeout=MAP_TOOL_DEADLINE_SECONDS
+    )
+    for poi, result in zip(pois, results):  # The pydantic object types.POI
         # Fill the place holders with verified information.
         poi["place_id"] = result["place_id"] if "place_id" in result else None
         poi["map_url"] = result["map_url"] if "map_url" in result else None
+        poi["verified"] = "place_id" in result
         if "lat" in result and "lng" in result:
             poi["lat"] = result["lat"]
             poi["long"] = result["lng"]
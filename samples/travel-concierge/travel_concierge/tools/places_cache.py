@@ -0,0 +1,164 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Two-tier cache for place lookups, shared across sessions."""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+PLACES_CACHE_PATH = os.getenv(
+    "PLACES_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "travel_concierge_places.sqlite"),
+)
+# Places API policies allow keeping lat/lng for up to 30 days.
+PLACES_CACHE_TTL_SECONDS = float(
+    os.getenv("PLACES_CACHE_TTL_SECONDS", str(30 * 24 * 3600))
+)
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "4096"))
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Collapses case and whitespace so equivalent queries share an entry."""
+    return " ".join(query.split()).casefold()
+
+
+class PlacesCache:
+    """An in-memory LRU in front of a SQLite table, keyed on normalized query text.
+
+    The in-memory tier keeps whole values. Only what persist returns is written
+    to SQLite, so fields that may not be stored can stay in memory. SQLite errors,
+    e.g. a locked database, are logged and treated as a miss.
+
+    Concurrent lookups of the same query are coalesced: the first caller fetches,
+    the others wait for its result instead of issuing their own request.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = PLACES_CACHE_PATH,
+        ttl_seconds: float = PLACES_CACHE_TTL_SECONDS,
+        max_entries: int = PLACES_CACHE_SIZE,
+        persist: Callable[[Dict[str, Any]], Dict[str, Any]] = lambda value: value,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.persist = persist
+        self._memory: OrderedDict[str, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS place_locations "
+                    "(query TEXT PRIMARY KEY, stored_at REAL, value TEXT)"
+                )
+                self._db.commit()
+            except sqlite3.OperationalError as e:
+                logger.warning("Places cache %s unavailable, keeping it in memory: %s", path, e)
+                self._db = None
+
+    def get_or_fetch(
+        self, query: str, fetch: Callable[[str], Optional[Dict[str, Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached value for a query, calling fetch on a miss.
+
+        Args:
+            query: The free text query.
+            fetch: Called with the query on a miss. Returning None means the
+                value must not be cached, e.g. on a transient error.
+
+        Returns:
+            The cached or freshly fetched value.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            value = self._get(key)
+            if value is not None:
+                return value
+            inflight = self._inflight.get(key)
+            owner = inflight is None
+            if owner:
+                inflight = self._inflight[key] = Future()
+
+        if not owner:
+            return inflight.result()
+
+        try:
+            value = fetch(query)
+            if value is not None:
+                with self._lock:
+                    self._put(key, value)
+            inflight.set_result(value)
+            return value
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None and now - entry[0] < self.ttl_seconds:
+            self._memory.move_to_end(key)
+            return entry[1]
+
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT stored_at, value FROM place_locations WHERE query = ?", (key,)
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            logger.warning("Reading the places cache failed: %s", e)
+            return None
+        if row is None or now - row[0] >= self.ttl_seconds:
+            return None
+        self._remember(key, (row[0], json.loads(row[1])))
+        return self._memory[key][1]
+
+    def _put(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        self._remember(key, (now, value))
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO place_locations VALUES (?, ?, ?)",
+                (key, now, json.dumps(self.persist(value))),
+            )
+            self._db.commit()
+        except sqlite3.OperationalError as e:
+            logger.warning("Writing the places cache failed: %s", e)
+            self._db.rollback()
+
+    def _remember(self, key: str, entry: tuple[float, Dict[str, Any]]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)